@@ -0,0 +1,318 @@
+# bench/loadgen.py
+"""
+Load generator / latency benchmark for the lobby and battlefield.
+
+Every simulated player registers and logs in over HTTP, then drives real
+Socket.IO clients through the same flow as the browser:
+
+    create_room → page_ready(team_select) → join_team → start_game
+    → battlefield join_room → `move` at --rate per second
+
+and the run reports event throughput, move → room_snapshot latency
+percentiles (the first snapshot that shows the player at a new
+position) and server CPU per room.
+
+    # self-contained: spawns bench/mock_server.py (mongomock) on --port
+    python bench/loadgen.py --spawn --rooms 4 --players 6 --rate 10 --duration 20
+
+    # against a running server (real mongod); CPU needs its pid on this host
+    python bench/loadgen.py --url http://localhost:8080 --server-pid 1234
+
+Requirements: bench/requirements.txt
+"""
+
+import argparse, json, os, re, subprocess, sys, tempfile, threading, time, uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import requests
+import socketio
+
+# ─── Tunables ────────────────────────────────────────────
+PASSWORD      = 'Bench-pass1!'        # satisfies validate_password
+STEP_TIMEOUT  = 15                    # seconds to wait for a setup event
+ECHO_TIMEOUT  = 1.0                   # a move with no snapshot by then is "unanswered"
+DIRECTIONS    = ('ArrowRight', 'ArrowDown', 'ArrowLeft', 'ArrowUp')   # stay near spawn
+BENCH_DIR     = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stats:
+    """Shared by every client thread."""
+
+    def __init__(self):
+        self.lock       = threading.Lock()
+        self.events     = Counter()
+        self.latencies: List[float] = []
+        self.moves      = 0
+        self.unanswered = 0
+        self.recording  = False
+
+    def event(self, name: str) -> None:
+        if self.recording:
+            with self.lock:
+                self.events[name] += 1
+
+
+class Player:
+    def __init__(self, base_url: str, name: str, stats: Stats):
+        self.base_url, self.name, self.stats = base_url, name, stats
+        self.http   = requests.Session()
+        self.lobby  = socketio.Client(reconnection=False)
+        self.battle = socketio.Client(reconnection=False)
+        self.seen: Dict[str, threading.Event] = {}
+        self.room_ids: Dict[str, str] = {}        # room_added name → id
+        self.position = None
+        self.pending_since: Optional[float] = None
+
+        for client, namespace in ((self.lobby, '/lobby'), (self.battle, '/battlefield')):
+            client.on('*', self._on_any, namespace=namespace)
+        self.battle.on('room_snapshot', self._on_snapshot, namespace='/battlefield')
+
+    # ── HTTP ────────────────────────────────────────────
+    def login(self) -> None:
+        form = {'username': self.name, 'password': PASSWORD}
+        self.http.post(f"{self.base_url}/register", data=form, allow_redirects=False)
+        r = self.http.post(f"{self.base_url}/login", data=form, allow_redirects=False)
+        if 'auth_token' not in self.http.cookies:
+            raise RuntimeError(f"login failed for {self.name}: HTTP {r.status_code}")
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {'Cookie': f"auth_token={self.http.cookies['auth_token']}"}
+
+    def room_socket_url(self, room_id: str) -> str:
+        """Owning worker for the room (util/cluster.py), or the base URL."""
+        page = self.http.get(f"{self.base_url}/lobby/{room_id}").text
+        match = re.search(r'const SOCKET_URL = "([^"]*)"', page)
+        return (match and match.group(1)) or self.base_url
+
+    # ── Socket.IO ───────────────────────────────────────
+    def expect(self, event: str) -> threading.Event:
+        return self.seen.setdefault(event, threading.Event())
+
+    def wait(self, event: str) -> None:
+        if not self.expect(event).wait(STEP_TIMEOUT):
+            raise TimeoutError(f"{self.name}: no '{event}' within {STEP_TIMEOUT}s")
+
+    def _on_any(self, event, *args):
+        self.stats.event(event)
+        self.expect(event).set()
+        if event == 'room_added' and args:
+            self.room_ids[args[0]['name']] = args[0]['id']
+            self.expect(f"room_added:{args[0]['name']}").set()
+
+    def _on_snapshot(self, data):
+        self._on_any('room_snapshot')
+        for pid, x, y in data.get('players', []):
+            if pid != self.name:
+                continue
+            if self.pending_since is not None and (x, y) != self.position:
+                with self.stats.lock:
+                    self.stats.latencies.append(time.perf_counter() - self.pending_since)
+                self.pending_since = None
+            self.position = (x, y)
+
+    def create_room(self, room_name: str) -> str:
+        lister = socketio.Client(reconnection=False)
+        lister.on('*', self._on_any, namespace='/lobby')
+        lister.connect(self.base_url, headers=self.headers, namespaces=['/lobby'])
+        lister.emit('page_ready', {'page': 'create_lobby'}, namespace='/lobby')
+        lister.emit('create_room', room_name, namespace='/lobby')
+        self.wait(f"room_added:{room_name}")
+        lister.disconnect()
+        return self.room_ids[room_name]
+
+    def join_team(self, url: str, room_id: str, team: str) -> None:
+        self.lobby.connect(f"{url}?page=team_select&room_id={room_id}",
+                           headers=self.headers, namespaces=['/lobby'])
+        self.lobby.emit('page_ready', {'page': 'team_select', 'room_id': room_id}, namespace='/lobby')
+        self.lobby.emit('join_team', {'team': team, 'room_id': room_id}, namespace='/lobby')
+        self.wait('joined_team')
+
+    def enter_battlefield(self, url: str, room_id: str) -> None:
+        self.battle.connect(f"{url}?page=battlefield&room={room_id}",
+                            headers=self.headers, namespaces=['/battlefield'])
+
+    def join_battle(self, room_id: str) -> None:
+        self.wait('game_started')
+        self.battle.emit('join_room', {'room_id': room_id, 'player': self.name, 'binary': False},
+                         namespace='/battlefield')
+        self.wait('player_positions')
+
+    def stream_moves(self, room_id: str, rate: float, until: float) -> None:
+        interval, i = 1.0 / rate, 0
+        next_send = time.perf_counter()
+        while next_send < until:
+            now = time.perf_counter()
+            if self.pending_since is not None and now - self.pending_since > ECHO_TIMEOUT:
+                with self.stats.lock:
+                    self.stats.unanswered += 1
+                self.pending_since = None
+            keys = {k: k == DIRECTIONS[i % len(DIRECTIONS)] for k in DIRECTIONS}
+            if self.pending_since is None:
+                self.pending_since = now
+            self.battle.emit('move', {'roomId': room_id, 'player': self.name, 'direction': keys},
+                             namespace='/battlefield')
+            with self.stats.lock:
+                self.stats.moves += 1
+            i += 1
+            next_send += interval
+            time.sleep(max(next_send - time.perf_counter(), 0))
+
+    def close(self) -> None:
+        for client in (self.lobby, self.battle):
+            if client.connected:
+                client.disconnect()
+
+
+# ─── Server side ────────────────────────────────────────
+def spawn_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ, BCRYPT_ROUNDS=os.environ.get('BCRYPT_ROUNDS', '4'))
+    proc = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'mock_server.py'), '--port', str(port)],
+                            cwd=tempfile.mkdtemp(prefix='mmogame-bench-'), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STEP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("mock server did not come up")
+
+
+def cpu_seconds(pid: Optional[int]) -> Optional[float]:
+    """utime + stime of <pid> from /proc (Linux only)."""
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# ─── Benchmark ──────────────────────────────────────────
+def setup_room(base_url: str, run_id: str, index: int, size: int, stats: Stats) -> Tuple[str, List[Player]]:
+    players = [Player(base_url, f"b{run_id}r{index}p{j}", stats) for j in range(size)]
+    for p in players:
+        p.login()
+
+    owner = players[0]
+    room_id = owner.create_room(f"bench-{run_id}-{index}")
+    url = owner.room_socket_url(room_id)
+
+    for j, p in enumerate(players):
+        p.join_team(url, room_id, 'red' if j % 2 == 0 else 'blue')
+        p.enter_battlefield(url, room_id)
+        p.expect('game_started')
+    owner.lobby.emit('start_game', {'room_id': room_id}, namespace='/lobby')
+    for p in players:
+        p.join_battle(room_id)
+    return room_id, players
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    k = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[k]
+
+
+def run(args) -> Dict:
+    stats, run_id = Stats(), uuid.uuid4().hex[:6]
+    server = spawn_server(args.port) if args.spawn else None
+    base_url = f"http://127.0.0.1:{args.port}" if args.spawn else args.url.rstrip('/')
+    server_pid = server.pid if server else args.server_pid
+    rooms: List = []
+    try:
+        setup = [None] * args.rooms
+        def _setup(i):
+            setup[i] = setup_room(base_url, run_id, i, args.players, stats)
+        threads = [threading.Thread(target=_setup, args=(i,)) for i in range(args.rooms)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        rooms = [r for r in setup if r]
+        if len(rooms) != args.rooms:
+            raise RuntimeError(f"only {len(rooms)}/{args.rooms} rooms started")
+
+        stats.recording = True
+        cpu_start, wall_start = cpu_seconds(server_pid), time.perf_counter()
+        until = wall_start + args.duration
+        streams = [threading.Thread(target=p.stream_moves, args=(room_id, args.rate, until))
+                   for room_id, players in rooms for p in players]
+        for t in streams: t.start()
+        for t in streams: t.join()
+        # rates and CPU cover the streaming window only, not the drain below
+        wall = time.perf_counter() - wall_start
+        cpu_end = cpu_seconds(server_pid)
+        time.sleep(ECHO_TIMEOUT)                      # let the last snapshots land
+        stats.recording = False
+    finally:
+        for _, players in rooms:
+            for p in players:
+                p.close()
+        if server:
+            server.terminate()
+            server.wait()
+
+    lat = sorted(l * 1000 for l in stats.latencies)
+    cpu = (cpu_end - cpu_start) if cpu_start is not None and cpu_end is not None else None
+    return {
+        "rooms": args.rooms, "players_per_room": args.players, "rate": args.rate,
+        "duration_s": round(wall, 2),
+        "moves_sent": stats.moves, "moves_per_s": round(stats.moves / wall, 1),
+        "events_received": sum(stats.events.values()),
+        "events_per_s": round(sum(stats.events.values()) / wall, 1),
+        "events_by_name": dict(stats.events.most_common()),
+        "latency_ms": {"n": len(lat), "unanswered": stats.unanswered,
+                       "p50": percentile(lat, 50), "p90": percentile(lat, 90),
+                       "p99": percentile(lat, 99), "max": lat[-1] if lat else float('nan')},
+        "server_cpu_s": cpu,
+        "cpu_pct_of_core": cpu and round(100 * cpu / wall, 1),
+        "cpu_pct_per_room": cpu and round(100 * cpu / wall / args.rooms, 2),
+    }
+
+
+def report(result: Dict) -> None:
+    lat = result["latency_ms"]
+    print(f"{result['rooms']} rooms × {result['players_per_room']} players, "
+          f"{result['rate']} moves/s each, {result['duration_s']} s")
+    print(f"  moves sent        {result['moves_sent']:>8}  ({result['moves_per_s']}/s)")
+    print(f"  events received   {result['events_received']:>8}  ({result['events_per_s']}/s)")
+    for name, count in result["events_by_name"].items():
+        print(f"      {name:<18}{count:>8}")
+    print(f"  move→snapshot ms  p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}  "
+          f"p99 {lat['p99']:.1f}  max {lat['max']:.1f}  (n={lat['n']}, unanswered={lat['unanswered']})")
+    if result["server_cpu_s"] is None:
+        print("  server CPU        n/a (pass --spawn or --server-pid on the server host)")
+    else:
+        print(f"  server CPU        {result['server_cpu_s']:.2f} s  → {result['cpu_pct_of_core']}% of a core, "
+              f"{result['cpu_pct_per_room']}% per room")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Lobby / battlefield load generator")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="running server, e.g. http://localhost:8080")
+    target.add_argument('--spawn', action='store_true', help="start bench/mock_server.py (mongomock)")
+    parser.add_argument('--port', type=int, default=8090, help="port for --spawn")
+    parser.add_argument('--server-pid', type=int, help="server pid for CPU accounting with --url")
+    parser.add_argument('--rooms', type=int, default=2)
+    parser.add_argument('--players', type=int, default=4, help="players per room")
+    parser.add_argument('--rate', type=float, default=10.0, help="moves per second per player")
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds of streaming")
+    parser.add_argument('--json', help="also write the result to this file")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+# bench/mock_server.py
+"""
+The real server.py with MongoDB swapped for an in-memory mongomock
+database, so the load generator can run anywhere without a mongod.
+
+    python bench/mock_server.py --port 8090
+
+bench/loadgen.py --spawn starts this for you.  Note that mongomock is
+pure Python, so Mongo-heavy paths (lobby, round boundaries) cost more
+CPU here than against a real mongod; the per-tick path never touches it.
+"""
+
+import argparse, os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mongomock
+import util.database as database
+
+# ─── Swap the collections before anything imports them ──
+_client = mongomock.MongoClient()
+database.mongo_client       = _client
+database.db                 = _client["mmo_game"]
+database.user_collection    = database.db["users"]
+database.chat_collection    = database.db["chat"]
+database.room_collection    = database.db["rooms"]
+database.terrain_collection = database.db["terrains"]
+
+import server   # noqa: E402  (monkey-patches eventlet, registers handlers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+    server.socketio.run(server.app, host=args.host, port=args.port,
+                        allow_unsafe_werkzeug=True, debug=False, log_output=False)
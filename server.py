@@ -10,11 +10,19 @@ from flask import Flask, render_template
 from flask_socketio import SocketIO
 from util.auth import auth_bp, hash_token
 from util.battlefield import battlefield_bp, register_battlefield_handlers
-from util.database import user_collection, room_collection
+from util.database import user_collection, room_collection, ensure_indexes, audit_query_plans, mongo_explain
 from util.rooms import register_room_handlers
+from util.log_pipeline import setup_logging, sample_raw_http, RAW_HTTP_BODIES, RAW_LOGGER
+from util import metrics, profiling, game_state, scheduler
+from util.inputs import input_counters
+from util.rooms import open_rooms
+from util.sessions import sid_users
+from util.cluster import socketio_options, socket_url_for_room, WORKER_ID, WORKERS, MESSAGE_QUEUE
+from util.room_store import RoomStore
 
 app = Flask(__name__)
-socketio = SocketIO(app, async_mode='eventlet')
+# message queue / client manager come from the environment (util/cluster.py)
+socketio = SocketIO(app, async_mode='eventlet', **socketio_options())
 @app.context_processor
 def inject_user():
     return dict(current_user=g.user)
@@ -32,7 +40,13 @@ def add_security_headers(response):
 
     logging.info(f"{ip} - {username} - {method} {path} → {status}")
 
-    if response.content_type and not response.content_type.startswith('text'):
+    if not getattr(g, 'raw_sampled', False):
+        return response
+
+    if not RAW_HTTP_BODIES or response.is_streamed or response.direct_passthrough:
+        # never force a streamed / passthrough body into memory just to log it
+        raw_logger.info(f"RESPONSE: {method} {path} → {status} — {response.content_type} (body not captured)")
+    elif response.content_type and not response.content_type.startswith('text'):
         raw_logger.info(f"RESPONSE: {method} {path} → {status} — {response.content_type} (not logged)")
     else:
         try:
@@ -49,25 +63,10 @@ def add_security_headers(response):
 
 app.config['SECRET_KEY'] = 'secret!'  # Replace with a secure key in production
 
-# Setup logging
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# Setup main logger
-logging.basicConfig(
-    filename='logs/server.log',
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-# Setup raw HTTP logger
-raw_logger = logging.getLogger('raw')
-raw_logger.setLevel(logging.INFO)
-raw_logger.propagate = False  
-raw_handler = logging.FileHandler('logs/raw_http.log')
-raw_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-raw_logger.addHandler(raw_handler)
+# Setup logging: queue + batched, rotating file writes (util/log_pipeline.py)
+log_listener = setup_logging()
+raw_logger = logging.getLogger(RAW_LOGGER)
+logging.info(f"Worker {WORKER_ID} of {len(WORKERS)} (message queue: {MESSAGE_QUEUE or 'none'})")
 
 def log_request_info():
     ip = request.remote_addr
@@ -77,6 +76,14 @@ def log_request_info():
 
     logging.info(f"{ip} - {username} - {method} {path}")
 
+    # Mongo time in this request is charged to the view (util/metrics.py)
+    metrics.set_handler(f"http:{request.endpoint}")
+
+    # Raw HTTP log is sampled (RAW_HTTP_SAMPLE_RATE); decided once per request
+    g.raw_sampled = sample_raw_http()
+    if not g.raw_sampled:
+        return
+
     # Raw request logging (limit to 2048 bytes, redact sensitive info)
     if request.content_type and 'multipart' in request.content_type:
         raw_logger.info(f"{method} {path} from {ip} — multipart form (headers only)")
@@ -86,17 +93,39 @@ def log_request_info():
     headers.pop('Cookie', None)  # Remove cookies
     sanitized_headers = {k: v for k, v in headers.items() if 'auth_token' not in v.lower()}
 
-    body_preview = request.get_data()[:2048].decode(errors='replace') if request.data else ''
+    body_preview = ''
+    if RAW_HTTP_BODIES and request.data:
+        body_preview = request.get_data()[:2048].decode(errors='replace')
 
     raw_logger.info(f"REQUEST: {method} {path} from {ip}\nHeaders: {sanitized_headers}\nBody:\n{body_preview}")
 
 app.before_request(log_request_info)
+app.teardown_request(lambda exc: metrics.set_handler(metrics.IDLE_HANDLER))
+
+# Metrics: scrape-time gauges + eventlet hub lag probe (util/metrics.py)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')   # set → /metrics needs "Authorization: Bearer <token>"
+metrics.register_gauge('game_active_rooms', 'Started rooms held in memory', lambda: len(game_state.rooms))
+metrics.register_gauge('game_active_players', 'Players in started rooms',
+                       lambda: sum(len(r['players']) for r in list(game_state.rooms.values())))
+metrics.register_gauge('lobby_open_rooms', 'Rooms waiting to start (this worker)', lambda: len(open_rooms))
+metrics.register_gauge('socketio_bound_sids', 'Sockets with a resolved user', lambda: len(sid_users))
+metrics.register_gauge('scheduler_pending_jobs', 'Pending countdown / round / respawn timers',
+                       scheduler.pending_count)
+metrics.register_gauge('game_inputs_total', 'Move inputs by outcome',
+                       lambda: {(k,): v for k, v in input_counters.items()}, ('outcome',), kind='counter')
+metrics.start_hub_monitor()
+
+# Mongo indexes for every hot query (+ optional plan audit)
+ensure_indexes()
+if mongo_explain:
+    audit_query_plans()
 
 # Blueprints and socketio event registration
 app.register_blueprint(auth_bp)
 app.register_blueprint(battlefield_bp)
 register_room_handlers(socketio, user_collection, room_collection)
 register_battlefield_handlers(socketio, user_collection, room_collection)
+room_store = RoomStore(room_collection)
 
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -109,20 +138,46 @@ def handle_exception(e):
 def index():
     return render_template('login.html')
 
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return "Forbidden", 403
+    return FlaskResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Sampled profiling (util/profiling.py): GET → status, POST {"rates": {"move": 0.01}}
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')   # unset → endpoint disabled
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    if not PROFILE_TOKEN or request.headers.get('Authorization') != f"Bearer {PROFILE_TOKEN}":
+        return "Forbidden", 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiling.set_rates(data.get('rates', {}))
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({"error": "rates must map handler names to 0.0–1.0"}), 400
+        if data.get('flush'):
+            profiling.flush()
+    return jsonify(profiling.status())
+
 @app.route('/lobby')
 def lobby():
     return render_template('lobby.html')
 
 @app.route('/lobby/<lobby_id>')
 def lobby_by_id(lobby_id):
-    room = room_collection.find_one({"id": lobby_id})
-    if not room:
+    room_name = room_store.name(lobby_id)
+    if room_name is None:
         return "Room not found", 404
-    return render_template('lobby_by_id.html', lobby_id=lobby_id, room_name=room["room_name"])
+    return render_template('lobby_by_id.html', lobby_id=lobby_id, room_name=room_name,
+                           socket_url=socket_url_for_room(lobby_id))
+
+# every view above goes through the sampled profiler
+profiling.wrap_views(app)
 
 # SocketIO Server run
 if __name__ == '__main__':
     try:
-        socketio.run(app, host='0.0.0.0', port=8080, allow_unsafe_werkzeug=True, debug=False)
+        socketio.run(app, host='0.0.0.0', port=int(os.environ.get('FLASK_RUN_PORT', 8080)), allow_unsafe_werkzeug=True, debug=False)
     except Exception:
         logging.exception("Unhandled server exception:\n" + traceback.format_exc())
@@ -0,0 +1,39 @@
+import logging, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util import log_pipeline
+
+
+def _lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_interleaved_records_reach_disk_without_stop(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_pipeline, 'LOG_DIR', str(tmp_path))
+    monkeypatch.setattr(log_pipeline, 'CLUSTERED', False)
+    root, raw = logging.getLogger(), logging.getLogger(log_pipeline.RAW_LOGGER)
+    before = (list(root.handlers), list(raw.handlers), root.level)
+
+    log_pipeline.setup_logging()
+    try:
+        # what every request does: one raw_http line, then one server line
+        for i in range(10):
+            raw.info("raw %d", i)
+            logging.info("server %d", i)
+
+        server_log, raw_log = tmp_path / 'server.log', tmp_path / 'raw_http.log'
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            if len(_lines(server_log)) == 10 and len(_lines(raw_log)) == 10:
+                break
+            time.sleep(0.05)
+
+        assert [line.split('] ')[1] for line in _lines(server_log)] == [f"server {i}" for i in range(10)]
+        assert [line.split('] ')[1] for line in _lines(raw_log)] == [f"raw {i}" for i in range(10)]
+    finally:
+        root.handlers[:], raw.handlers[:] = before[0], before[1]
+        root.setLevel(before[2])
@@ -6,9 +6,11 @@ from flask import Flask, render_template, Blueprint, redirect, jsonify
 from flask import request, g
 from flask import request,make_response
 import uuid
-import bcrypt
-import hashlib
 from util.database import user_collection
+from util.users import invalidate_user
+from util.leaderboard import leaderboard_page, DEFAULT_LIMIT
+from util.passwords import hash_password, check_password
+from util.sessions import hash_token, remember_session, forget_session, user_for_token, SESSION_TTL
 from flask import current_app, render_template, request, redirect, url_for, g
 from werkzeug.utils import secure_filename
 auth_bp = Blueprint('auth', __name__)
@@ -35,7 +37,7 @@ def register():
         return render_template('register.html', error="Username already taken")
 
     # Success
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    hashed_pw = hash_password(password)   # runs in tpool, not on the hub
     user_id = str(uuid.uuid4())
 
     user_collection.insert_one({
@@ -69,7 +71,7 @@ def login():
         logging.info(f"Login attempt failed: username '{user}' does not exist")
         return render_template("login.html", error="Incorrect username")
 
-    if not bcrypt.checkpw(password.encode(), dbEntry["password"].encode()):
+    if not check_password(password, dbEntry["password"]):
         logging.info(f"Login attempt failed: wrong password for user '{user}'")
         return render_template("login.html", error="Incorrect password")
 
@@ -77,10 +79,11 @@ def login():
     token = str(uuid.uuid4())
     hashed = hash_token(token)
     user_collection.update_one({"username": user}, {"$set": {"auth_token": hashed}})
+    remember_session(hashed, user)
     logging.info(f"Login successful: user '{user}'")
 
     resp = make_response(redirect("/lobby"))
-    resp.set_cookie("auth_token", token, httponly=True, max_age=3600)
+    resp.set_cookie("auth_token", token, httponly=True, max_age=SESSION_TTL)
     return resp
 
 @auth_bp.route('/logout', methods=['POST'])
@@ -89,7 +92,8 @@ def logout():
 
     if token:
         hashed = hash_token(token)
-        user = user_collection.find_one({"auth_token": hashed})
+        user = user_for_token(token)
+        forget_session(hashed)
         if user:
             logging.info(f"User '{user['username']}' logged out")
             user_collection.update_one({"auth_token": hashed}, {"$unset": {"auth_token": ""}})
@@ -108,17 +112,12 @@ def validate_password(string):
     if not re.fullmatch(r'[A-Za-z0-9!@#$%^&()\-_=]+', string): return False
     return True
 
-# hash auth token for DB storage
-def hash_token(token: str) -> str:
-    return hashlib.sha256(token.encode()).hexdigest()
-
-
 @auth_bp.before_app_request
 def load_CurrentUser():
 
     token = request.cookies.get("auth_token")
     if token:
-        g.user = user_collection.find_one({"auth_token": hash_token(token)})
+        g.user = user_for_token(token)   # cached session → cached profile
     else:
         g.user = None
 ALLOWED_EXT = {'png','jpg','jpeg'}
@@ -145,6 +144,7 @@ def profile():
                 {'username': user['username']},
                 {'$set': {'avatar': filename}}
             )
+            invalidate_user(user['username'])
         return redirect(url_for('auth.profile'))
 
     # GET — render form
@@ -154,11 +154,7 @@ def profile():
 
 @auth_bp.route('/api/whoami')
 def whoami():
-    token = request.cookies.get("auth_token")
-    if not token:
-        return jsonify({"username": None})
-
-    user = user_collection.find_one({"auth_token": hash_token(token)})
+    user = getattr(g, 'user', None)   # resolved by load_CurrentUser
     if user:
         return jsonify({"username": user["username"]})
 
@@ -166,14 +162,14 @@ def whoami():
 
 @auth_bp.route('/api/leaderboard')
 def leaderboard():
-    # Fetch all users
-    users = list(user_collection.find({}, {"_id": 0, "username": 1, "wins": 1}))
-
-    # Add default 0 for missing 'wins' field
-    for u in users:
-        u["wins"] = u.get("wins", 0)
-
-    # Sort in Python instead of MongoDB
-    sorted_users = sorted(users, key=lambda u: u["wins"], reverse=True)
-
-    return jsonify(sorted_users)
+    # Top-N page from the (wins, username) index, cached until wins change
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    body, etag = leaderboard_page(offset, limit)
+
+    # Clients that refresh together after `leaderboard_updated` get 304s
+    resp = make_response(body)
+    resp.mimetype = 'application/json'
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
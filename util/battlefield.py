@@ -1,10 +1,18 @@
-from flask import Blueprint, render_template, request
+import os
+import re
+from flask import Blueprint, render_template, request, make_response
 from flask_socketio import emit, join_room
-from util.auth import hash_token
-from eventlet import sleep
-from eventlet.semaphore import Semaphore
-import math
+from util.sessions import socket_user, bind_sid, unbind_sid, track_sid, untrack_sid, sid_rooms
 from util.rooms import choose_avatar
+from util import game_state
+from util.inputs import submit_input, forget_sid
+from util.users import get_users
+from util import snapshots
+from util import metrics
+from util import scheduler
+from util.cluster import owns_room, socket_url_for_room
+from util.terrain import terrain_blob
+from util.room_store import RoomStore
 
 # Constants for map size
 MAP_WIDTH = 30
@@ -23,19 +31,72 @@ for y in range(MAP_HEIGHT):
             terrain[y][x] = 1  # scattered maze walls
 
 
-# Global memory
-room_player_data = {}  # { room_id: { player_name: {"x": int, "y": int, "team": str} } }
-player_status = {}     # { room_id: { player_name: "alive" or "dead", dx: -2.0 - 2.0, dy: -2.0 - 2.0} }
-room_player_data_lock = Semaphore()
-player_status_lock = Semaphore()
+# Global memory: positions / teams / terrain live in util.game_state,
+# dead/alive status in util.simulation
+
+# ─── Reconnect grace window ─────────────────────────────
+# A dropped player's slot stays in memory this long; a client that re-joins
+# with {resume: true} in time gets a compact `resume_state` instead of the
+# full player_positions + load_terrain reload.  0 → drop immediately.
+RECONNECT_GRACE_SEC = float(os.environ.get('RECONNECT_GRACE_SEC', 10))
+
+# (room_id, username) → scheduler job that finally removes the player
+grace_jobs = {}
+
+
+def _cancel_grace(room_id, username):
+    job = grace_jobs.pop((room_id, username), None)
+    if job:
+        scheduler.cancel(job)
+    return job is not None
+
+
+@game_state.on_drop
+def _forget_grace(room_id):
+    # the jobs themselves went with scheduler.cancel_key(room_id)
+    for key in [k for k in grace_jobs if k[0] == room_id]:
+        grace_jobs.pop(key, None)
+
+
+def resume_state(state):
+    """Compact resync: [[id, x, y, team], ...] – no avatars, no terrain."""
+    with game_state.rooms_lock:
+        players = [[pid, p["x"], p["y"], p.get("team")] for pid, p in state["players"].items()]
+    return {"tick": state["seq"], "players": players}
+
+
+def _current_players(room_store, room_id):
+    """Players list for <room_id>: memory once the game runs, Mongo before that."""
+    state = game_state.get_room(room_id)
+    if state:
+        return game_state.players_list(state), state
+    room = room_store.join_view(room_id)   # avatars + terrain id, nothing else
+    if not room:
+        return None, None
+    return room.get('players', []), room
 
 def register_battlefield_handlers(socketio, user_collection, room_collection):
+    room_store = RoomStore(room_collection)
 
-    @socketio.on('connect', namespace='/battlefield')
+    @metrics.on(socketio, 'connect', namespace='/battlefield')
     def handle_battlefield_connect():
         print('Client connected to battlefield')
-
-    @socketio.on('join_room', namespace='/battlefield')
+        # 🧭 a room's game state lives on one worker only (util/cluster.py)
+        if not owns_room(request.args.get('room')):
+            return False
+        # 🔑 resolve the cookie once; events read the user bound to this sid
+        bind_sid(request.sid, request.cookies.get('auth_token'))
+
+    def _drop_player(room_id, username):
+        room_store.remove_player(room_id, username)
+        game_state.remove_player(room_id, username)
+        socketio.emit('player_left', {'id': username}, room=room_id, namespace='/battlefield')
+
+    def _grace_expired(room_id, username):
+        if grace_jobs.pop((room_id, username), None):
+            _drop_player(room_id, username)
+
+    @metrics.on(socketio, 'join_room', namespace='/battlefield')
     def handle_battlefield_join_room(data):
         room_id = data.get('room_id')
         player_id = data.get('player')
@@ -43,27 +104,51 @@ def register_battlefield_handlers(socketio, user_collection, room_collection):
         if room_id:
             join_room(room_id)
 
+            # 🗂️ sid → (user, room) for query-free disconnect cleanup
+            user = socket_user()
+            username = user['username'] if user else None
+            if username:
+                track_sid(request.sid, username, room_id, '/battlefield')
+                _cancel_grace(room_id, username)     # back within the window
+
+            # 🔁 same page reconnecting: it still has terrain + avatars
+            state = game_state.get_room(room_id)
+            if data.get('resume') and state and username in state['players']:
+                if data.get('binary'):
+                    snapshots.subscribe(state, request.sid)
+                else:
+                    join_room(snapshots.json_room(room_id))
+                emit('resume_state', resume_state(state), room=request.sid, namespace='/battlefield')
+                if data.get('binary'):
+                    snapshots.send_keyframe(socketio, state, request.sid)
+                return
+
             # 🔥 Immediately emit the current player positions after joining
-            room = room_collection.find_one({"id": room_id})
-            if not room:
+            players, room = _current_players(room_store, room_id)
+            if room is None:
                 return
 
-            players = room.get('players', [])
             updated_players = []
-
-            room_doc = room_collection.find_one({"id": room_id})
-
+            profiles = get_users(p["id"] for p in players)
             for p in players:
-                user_doc = user_collection.find_one({"username": p["id"]})
-                p["avatar"] = choose_avatar(p["id"], room_doc, user_doc)
+                p["avatar"] = choose_avatar(p["id"], room, profiles.get(p["id"], {}))
                 updated_players.append(p)
 
-            emit('player_positions', updated_players, room=request.sid, namespace='/battlefield')
-            terrain_data = room.get('terrain')
-            if terrain_data:
-                emit('load_terrain', {'terrain': terrain_data}, room=request.sid, namespace='/battlefield')
-
-    @socketio.on('move', namespace='/battlefield')
+            if data.get('binary') and state:
+                # 📦 opt-in binary protocol: static roster once, then packed deltas
+                snapshots.subscribe(state, request.sid)
+                avatars = {p["id"]: p["avatar"] for p in updated_players}
+                emit('roster', snapshots.roster(state, avatars), room=request.sid, namespace='/battlefield')
+                snapshots.send_keyframe(socketio, state, request.sid)
+            else:
+                join_room(snapshots.json_room(room_id))
+                emit('player_positions', updated_players, room=request.sid, namespace='/battlefield')
+            # 🗺️ just the id – the page fetches (and caches) GET /terrain/<id>
+            terrain_id = room.get('terrain_id')
+            if terrain_id:
+                emit('load_terrain', {'terrain_id': terrain_id}, room=request.sid, namespace='/battlefield')
+
+    @metrics.on(socketio, 'move', namespace='/battlefield')
     def handle_move(data):
         room_id = data.get('roomId')
         player = data.get('player')
@@ -72,218 +157,61 @@ def register_battlefield_handlers(socketio, user_collection, room_collection):
         if not room_id or not player or not keyPress:
             return
 
-        room = room_collection.find_one({'id': room_id})
-        if not room:
-            return
-
-        # fetch once
-        terrain = room.get('terrain', [[0] * MAP_WIDTH for _ in range(MAP_HEIGHT)])
-        player_list = room.get('players', [])
-        player_data = next((p for p in player_list if p['id'] == player), None)
-        if not player_data:
-            return
-
-        with player_status_lock:
-            if player_status.get(room_id, {}).get(player, {}).get('status') == "dead":
-                return
-
-
-        # movement logic
-        new_x, new_y = player_data['x'], player_data['y']
-        if keyPress['ArrowUp']:
-            new_y = round((new_y - 0.1)*100)/100
-        if keyPress['ArrowDown']:
-            new_y = round((new_y + 0.1)*100)/100
-        if keyPress['ArrowLeft']:
-            new_x = round((new_x - 0.1)*100)/100
-        if keyPress['ArrowRight']:
-            new_x = round((new_x + 0.1)*100)/100
-
-        x_check, y_check = False, False
-        if not 0 <= new_x <= MAP_WIDTH-1:
-            new_x = clamp(new_x, 0, MAP_WIDTH-1)
-            x_check = True
-        if not 0 <= new_y <= MAP_HEIGHT-1:
-            new_y = clamp(new_y, 0, MAP_HEIGHT-1)
-            y_check = True
-        if x_check and y_check:
-            return
+        # 🧠 just queue it – the room's tick loop applies it (util.simulation);
+        # util.inputs drops rate-limited / duplicate frames first
+        submit_input(request.sid, room_id, player, keyPress)
 
-        f_new_x = math.floor(new_x)
-        c_new_x = math.ceil(new_x) if new_x % 1 != 0 else f_new_x
-        f_new_y = math.floor(new_y)
-        c_new_y = math.ceil(new_y) if new_y % 1 != 0 else f_new_y
-
-        tileTL = terrain[f_new_y][f_new_x]
-        tileTR = terrain[f_new_y][c_new_x]
-        tileBL = terrain[c_new_y][f_new_x]
-        tileBR = terrain[c_new_y][c_new_x]
-
-        old_x = new_x
-        enemy_team_num = 3 if player_data.get('team') == 'blue' else 2
-
-        if new_x != player_data['x'] and f_new_x != c_new_x:
-            if new_x < player_data['x']:
-                if (tileTL in (1, enemy_team_num)) or (tileBL in (1, enemy_team_num)):
-                    new_x = player_data['x']
-            elif new_x > player_data['x']:
-                if (tileTR in (1, enemy_team_num)) or (tileBR in (1, enemy_team_num)):
-                    new_x = player_data['x']
-
-        if new_y != player_data['y'] and f_new_y != c_new_y:
-            if new_y > player_data['y']:
-                if (tileBL in (1, enemy_team_num)) or (tileBR in (1, enemy_team_num)):
-                    new_y = player_data['y']
-            elif new_y < player_data['y']:
-                if (tileTL in (1, enemy_team_num)) or (tileTR in (1, enemy_team_num)):
-                    new_y = player_data['y']
-
-        result = room_collection.update_one(
-            {'id': room_id, 'players.id': player},
-            {'$set': {'players.$.x': new_x, 'players.$.y': new_y}}
-        )
-        if result.matched_count == 0:
-            return
+    @metrics.on(socketio, 'snapshot_ack', namespace='/battlefield')
+    def handle_snapshot_ack(data):
+        # binary clients confirm the newest snapshot they applied → next delta base
+        if isinstance(data, dict):
+            snapshots.acknowledge(request.sid, data.get('seq'))
 
-        # update in-memory and enrich with avatars
-        user_cache = {}
-        for p in room['players']:
-            pid = p['id']
-            if pid not in user_cache:
-                user_cache[pid] = user_collection.find_one({"username": pid}) or {}
-            p['avatar'] = choose_avatar(pid, room, user_cache[pid])
-
-        with room_player_data_lock:
-            room_player_data[room_id] = {
-                p['id']: {'x': p['x'], 'y': p['y']}
-                for p in room['players'] if p.get('id')
-            }
-
-
-        # tagging logic
-        attacking_team = room.get('attacking_team')
-        if attacking_team:
-            with room_player_data_lock:
-                for other_id, pos in room_player_data[room_id].items():
-                    if other_id == player:
-                        continue
-                    if abs(pos['x'] - new_x) <= 1 and abs(pos['y'] - new_y) <= 1:
-                        target_data = next((p for p in room['players'] if p['id'] == other_id), None)
-                        if not target_data:
-                            continue
-
-                        mover_team = player_data.get('team')
-                        target_team = target_data.get('team')
-                        if mover_team == target_team:
-                            continue
-
-                        if mover_team == attacking_team:
-                            victim, tagger = other_id, player
-                        elif target_team == attacking_team:
-                            victim, tagger = player, other_id
-                        else:
-                            continue
-
-                        with player_status_lock:
-                            if player_status.get(room_id, {}).get(victim, {}).get('status') == 'dead':
-                                continue
-                            player_status.setdefault(room_id, {})[victim] = {'status': 'dead', 'tagger': tagger}
-                        emit('player_tagged', {'tagger': tagger, 'target': victim}, room=room_id)
-                        socketio.start_background_task(respawn_player, socketio, room_collection, room_id, victim)
-                        break
-
-        emit('player_moved', {'id': player, 'x': new_x, 'y': new_y}, room=room_id, namespace='/battlefield')
-
-    @socketio.on('disconnect', namespace='/battlefield')
+    @metrics.on(socketio, 'disconnect', namespace='/battlefield')
     def handle_battlefield_disconnect():
         sid = request.sid
 
-        auth_token = request.cookies.get('auth_token')
-        if not auth_token:
+        unbind_sid(sid)
+        forget_sid(sid)
+        snapshots.forget_sid(sid)
+        entry = untrack_sid(sid)
+        if not entry:
             return
 
-        user = user_collection.find_one({'auth_token': hash_token(auth_token)})
-        if not user:
+        # ✅ the index says which room – no players.id scan
+        username, room_id, _ = entry
+        state = game_state.get_room(room_id)
+        if RECONNECT_GRACE_SEC > 0 and state and username in state['players']:
+            # ⏳ keep the slot; a reconnect within the window cancels this
+            _cancel_grace(room_id, username)
+            grace_jobs[(room_id, username)] = scheduler.schedule(
+                RECONNECT_GRACE_SEC, _grace_expired, room_id, username, key=room_id)
             return
 
-        username = user['username']
-
-
-        rooms = list(room_collection.find({"players.id": username}))
-
-        for room in rooms:
-            room_id = room["id"]
-            room_collection.update_one(
-                {"id": room_id},
-                {"$pull": {"players": {"id": username}}
-            })
-
-            updated = room_collection.find_one({"id": room_id})
-            socketio.emit('player_left', {'id': username}, room=room_id, namespace='/battlefield')
+        _drop_player(room_id, username)
 
     #gives latest player info after respawn
-    @socketio.on('request_positions', namespace='/battlefield')
+    @metrics.on(socketio, 'request_positions', namespace='/battlefield')
     def handle_request_positions():
-        auth_token = request.cookies.get('auth_token')
-        if not auth_token:
+        # the room this sid joined (util.sessions index) – no players.id lookup
+        entry = sid_rooms.get(request.sid)
+        if not entry:
             return
 
-        user = user_collection.find_one({'auth_token': hash_token(auth_token)})
-        if not user:
-            return
-
-        username = user['username']
-
-        # Find the room the user is in and get the latest full document
-        room = room_collection.find_one({"players.id": username})
-        if not room:
-            return
+        _, room_id, _ = entry
 
-        room_id = room['id']
-        
-        # Now re-fetch the full room document by its id to ensure up-to-date player list
-        updated_room = room_collection.find_one({"id": room_id})
-        if not updated_room:
+        # Binary subscribers resync with a keyframe instead of the JSON list
+        state = game_state.get_room(room_id)
+        if state and request.sid in state['bin_clients']:
+            snapshots.send_keyframe(socketio, state, request.sid)
             return
 
-        emit('player_positions', updated_room.get('players', []), room=request.sid, namespace='/battlefield')
-
-
-def respawn_player(socketio, room_collection, room_id, player):
-    sleep(5)  # 5 seconds dead
-
-    with player_status_lock:
-        if room_id not in player_status or player not in player_status[room_id]:
+        # Positions after the game starts live in memory, not in the document
+        players, _ = _current_players(room_store, room_id)
+        if players is None:
             return
-        tagger = player_status[room_id][player].get('tagger')
-
-    # Fetch the tagger's team
-    room = room_collection.find_one({'id': room_id})
-    if not room:
-        return
 
-    tagger_data = next((p for p in room.get('players', []) if p['id'] == tagger), None)
-    if not tagger_data:
-        return
-
-    new_team = tagger_data['team']
-
-    # Update the player's team in database
-    room_collection.update_one(
-        {"id": room_id, "players.id": player},
-        {"$set": {"players.$.team": new_team}}
-    )
-    updated_room = room_collection.find_one({"id": room_id})
-    socketio.emit('player_positions', updated_room.get('players', []), room=room_id, namespace='/battlefield')
-
-    # Mark as alive
-    with player_status_lock:
-        player_status[room_id][player] = {
-            "status": "alive"
-        }
-
-    # Tell clients
-    socketio.emit('player_respawned', {"player": player}, room=room_id, namespace='/battlefield')
+        emit('player_positions', players, room=request.sid, namespace='/battlefield')
 
 
 # Blueprint
@@ -294,7 +222,23 @@ def battlefield():
     room_id = request.args.get('room')
     if not room_id:
         return "Missing room ID", 400
-    return render_template('battlefield.html', room_id=room_id)
-
-def clamp(value, min_value, max_value):
-    return max(min_value, min(value, max_value))
\ No newline at end of file
+    return render_template('battlefield.html', room_id=room_id,
+                           socket_url=socket_url_for_room(room_id))
+
+
+TERRAIN_ID = re.compile(r'[0-9a-f]{40}')
+
+@battlefield_bp.route('/terrain/<terrain_id>')
+def terrain_file(terrain_id):
+    # Content-addressed: the bytes behind an id never change, so browsers keep them
+    if not TERRAIN_ID.fullmatch(terrain_id):
+        return "Unknown terrain", 404
+    blob = terrain_blob(terrain_id)
+    if blob is None:
+        return "Unknown terrain", 404
+
+    resp = make_response(blob)
+    resp.mimetype = 'application/octet-stream'
+    resp.set_etag(terrain_id)
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp.make_conditional(request)
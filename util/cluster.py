@@ -0,0 +1,164 @@
+# util/cluster.py
+"""
+Running several server processes side by side.
+
+Everything a room needs at play time (util.game_state, util.rounds,
+util.simulation, util.scheduler) lives in the memory of one process, so
+each room is owned by exactly one worker:
+
+    owner = consistent-hash ring over WORKERS, keyed by the room id
+
+Pages tell the browser which worker to open the room's socket on
+(`socket_url_for_room`) and room-scoped socket connects to any other
+worker are refused.  Emits that must reach sockets on other workers
+(lobby list, leaderboard) travel over Flask-SocketIO's message queue.
+
+Env switches:
+    WORKER_ID                this process' name on the ring        (default "w0")
+    WORKERS                  "w0=http://host:8081,w1=http://host:8082"
+                             (URL optional when a proxy routes by ?room=)
+    SOCKETIO_MESSAGE_QUEUE   redis:// | kafka:// | zmq+tcp:// | amqp:// ...
+                             or local:///path  → LocalSocketManager below
+    CLUSTER_CACHE_TTL        max age of per-process caches other workers
+                             can invalidate (sessions, profiles, ...)  (default 5 s)
+"""
+
+import atexit, bisect, errno, glob, hashlib, logging, os, stat
+from typing import Dict, List, Optional
+from eventlet.green import socket
+from socketio.pubsub_manager import PubSubManager
+
+# ─── Tunables ────────────────────────────────────────────
+WORKER_ID         = os.environ.get('WORKER_ID', 'w0')
+MESSAGE_QUEUE     = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+CLUSTER_CACHE_TTL = int(os.environ.get('CLUSTER_CACHE_TTL', 5))
+RING_REPLICAS     = 160           # virtual nodes per worker
+LOCAL_MAX_DGRAM   = 1 << 20       # largest bus message (bytes)
+
+
+def _parse_workers(spec: str) -> Dict[str, str]:
+    """ "w0=http://a:8081,w1" → {"w0": "http://a:8081", "w1": ""} """
+    workers = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, url = item.partition('=')
+        workers[name.strip()] = url.strip().rstrip('/')
+    return workers
+
+
+WORKERS   = _parse_workers(os.environ.get('WORKERS', '')) or {WORKER_ID: ''}
+CLUSTERED = len(WORKERS) > 1 or bool(MESSAGE_QUEUE)
+
+
+# ─── Consistent hashing ─────────────────────────────────
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Adding / removing a worker only moves ~1/N of the rooms."""
+
+    def __init__(self, nodes, replicas: int = RING_REPLICAS):
+        points = sorted((_hash(f"{node}#{i}"), node)
+                        for node in nodes for i in range(replicas))
+        self._keys:  List[int] = [p for p, _ in points]
+        self._nodes: List[str] = [n for _, n in points]
+
+    def node_for(self, key: str) -> str:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+ring = HashRing(WORKERS)
+
+
+def worker_for_room(room_id: str) -> str:
+    return ring.node_for(str(room_id))
+
+
+def owns_room(room_id: Optional[str]) -> bool:
+    return not room_id or worker_for_room(room_id) == WORKER_ID
+
+
+def socket_url_for_room(room_id: str) -> str:
+    """Origin the room's socket should connect to ('' → same origin)."""
+    owner = worker_for_room(room_id)
+    return '' if owner == WORKER_ID else WORKERS.get(owner, '')
+
+
+def socketio_options() -> Dict:
+    """Extra SocketIO(...) kwargs for the configured message queue."""
+    options = {}
+    origins = [url for url in WORKERS.values() if url]
+    if origins:                     # pages on one worker, sockets on another
+        options['cors_allowed_origins'] = origins
+    if MESSAGE_QUEUE.startswith('local://'):
+        options['client_manager'] = LocalSocketManager(MESSAGE_QUEUE)
+    elif MESSAGE_QUEUE:
+        options['message_queue'] = MESSAGE_QUEUE
+    return options
+
+
+# ─── Network-free broker (one host: dev, tests, CI) ─────
+class LocalSocketManager(PubSubManager):
+    """Socket.IO pub/sub over Unix datagram sockets.
+
+    Every listening process binds <dir>/<channel>/<host_id>.sock; publishing
+    sends one datagram to each socket in that directory.  Sockets left
+    behind by dead processes are removed on the first failed send.
+    Messages are JSON (binary attachments arrive base64-encoded), and the
+    bus directory must belong to this user with no group/other access.
+
+        SOCKETIO_MESSAGE_QUEUE=local:///tmp/mmogame-bus
+    """
+    name = 'local'
+
+    def __init__(self, url='local:///tmp/mmogame-bus', channel='flask-socketio',
+                 write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only,
+                         logger=logger, json=json)
+        base_dir = url[len('local://'):] or '/tmp/mmogame-bus'
+        self.bus_dir = os.path.join(base_dir, channel)
+        for path in (base_dir, self.bus_dir):
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            self._check_private(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, LOCAL_MAX_DGRAM)
+        self._path = None
+        if not write_only:
+            self._path = os.path.join(self.bus_dir, f"{self.host_id}.sock")
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, LOCAL_MAX_DGRAM)
+            self._sock.bind(self._path)
+            atexit.register(self._unlink, self._path)
+
+    def _publish(self, data):
+        payload = self.json.dumps(data).encode()
+        for path in glob.glob(os.path.join(self.bus_dir, '*.sock')):
+            try:
+                self._sock.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if path != self._path:
+                    self._unlink(path)      # listener is gone
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                logging.warning(f"Message bus: {path} is full, dropped {data.get('method')}")
+
+    def _listen(self):
+        while True:
+            yield self._sock.recv(LOCAL_MAX_DGRAM)   # PubSubManager json-decodes it
+
+    @staticmethod
+    def _check_private(path: str) -> None:
+        # makedirs(mode=...) doesn't touch a directory that already exists
+        st = os.lstat(path)
+        if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid()
+                or st.st_mode & (stat.S_IRWXG | stat.S_IRWXO)):
+            raise PermissionError(f"Message bus directory {path} must be a directory owned by "
+                                  f"uid {os.geteuid()} with mode 0700")
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
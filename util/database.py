@@ -1,17 +1,98 @@
 import os
-from pymongo import MongoClient
+import logging
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, ConnectionFailure
+from util.metrics import MongoCommandMetrics
 
 # Check if running inside Docker
 docker_db = os.environ.get('DOCKER_DB', "false").lower() == "true"
 
+# Diagnostic: explain() the hot queries at startup and warn on COLLSCAN
+mongo_explain = os.environ.get('MONGO_EXPLAIN', "false").lower() == "true"
+
 # Set up MongoDB connection string
 if docker_db:
-    mongo_client = MongoClient("mongodb://mongo:27017")  # docker-compose service name
+    mongo_client = MongoClient("mongodb://mongo:27017",  # docker-compose service name
+                               event_listeners=[MongoCommandMetrics()])
 else:
-    mongo_client = MongoClient("mongodb://localhost:27017")
+    mongo_client = MongoClient("mongodb://localhost:27017",
+                               event_listeners=[MongoCommandMetrics()])
 
 # Access the database and collections
 db = mongo_client["mmo_game"]
 user_collection = db["users"]
 chat_collection = db["chat"]
-room_collection = db["rooms"]
\ No newline at end of file
+room_collection = db["rooms"]
+terrain_collection = db["terrains"]   # packed blobs keyed by content hash (util/terrain.py)
+
+# ─── Indexes ─────────────────────────────────────────────
+# Every hot-path filter in util/ must be covered by one of these.
+USER_INDEXES = [
+    ([("username", ASCENDING)],   {"unique": True}),
+    ([("auth_token", ASCENDING)], {}),
+    ([("wins", DESCENDING), ("username", ASCENDING)], {}),   # leaderboard
+]
+ROOM_INDEXES = [
+    ([("id", ASCENDING)],           {"unique": True}),
+    ([("game_started", ASCENDING)], {}),
+]
+# Disconnects resolve their room from util.sessions.sid_rooms, so the old
+# players.id / red_team / blue_team / no_team lookup indexes are gone; drop
+# them on existing deployments to save the write cost on every team change.
+
+# (collection name, filter[, sort]) tuples mirroring the hot queries, for explain()
+HOT_QUERIES = [
+    ("users", {"username": "_"}),
+    ("users", {"auth_token": "_"}),
+    ("users", {}, [("wins", -1), ("username", 1)]),
+    ("rooms", {"id": "_"}),
+    ("rooms", {"game_started": False}),
+]
+
+
+def ensure_indexes() -> None:
+    """Create the indexes above (no-op for ones that already exist)."""
+    for collection, indexes in ((user_collection, USER_INDEXES),
+                                (room_collection, ROOM_INDEXES)):
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except ConnectionFailure:
+                logging.exception("Mongo unreachable – skipping index bootstrap")
+                return
+            except PyMongoError:
+                # e.g. duplicate usernames already stored → unique index refused
+                logging.exception(f"Could not create index {keys} on {collection.name}")
+
+
+def audit_query_plans() -> None:
+    """explain() every hot query and warn about collection scans."""
+    for name, query, *sort in HOT_QUERIES:
+        collection = db[name]
+        try:
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort[0])
+            plan = cursor.explain()
+        except PyMongoError:
+            logging.exception(f"explain() failed for {collection.name} {query}")
+            continue
+        stages = _plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            logging.warning(f"COLLSCAN: {collection.name}.find({query}) – add an index")
+        else:
+            logging.info(f"Query plan OK: {collection.name}.find({query}) → {' > '.join(stages)}")
+
+
+def _plan_stages(node) -> list:
+    """Flatten every "stage" name in an explain() plan tree."""
+    stages = []
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        for value in node.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(node, list):
+        for value in node:
+            stages.extend(_plan_stages(value))
+    return stages
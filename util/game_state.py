@@ -0,0 +1,151 @@
+# util/game_state.py
+"""
+Authoritative in-memory state for games that have started.
+
+Once the owner presses ‘Start Game’ the room document is loaded here and
+every frame (moves, tags, respawns) is served from memory.  MongoDB only
+gets a snapshot at round boundaries (start, tagger flip, round end).
+
+    rooms[room_id] = {
+        "id":             str,
+        "terrain":        [[int, ...], ...],
+        "terrain_id":     content hash of the packed terrain (util.terrain),
+        "width", "height": map size in tiles,
+        "collision":      per-team blocked bitmaps (util.terrain),
+        "attacking_team": "red" / "blue" / None,
+        "red_team":       [username, ...],     # lobby lists, for avatars
+        "blue_team":      [username, ...],
+        "players":        {username: {"x", "y", "team", "is_tagger"}},
+        "inputs":         {username: latest arrow-key dict},  # drained per tick
+        "grid":           SpatialGrid of player positions (tag lookups),
+        "slot_ids":       [username, ...],   # index = binary protocol slot
+        "seq":            last published snapshot tick,
+        "history":        OrderedDict seq → quantized positions (util.snapshots),
+        "bin_clients":    {sid: last acknowledged seq},
+    }
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from eventlet.semaphore import Semaphore
+from util.spatial import SpatialGrid
+from util.terrain import maps_for, drop_room_maps, load_terrain, save_terrain
+from util.room_store import RoomStore
+
+# ─── Tunables ────────────────────────────────────────────
+MAP_WIDTH  = 30
+MAP_HEIGHT = 20
+
+# ─── In-memory tracker:  room_id → state dict (see above) ──
+rooms: Dict[str, Dict] = {}
+rooms_lock = Semaphore()
+
+# modules with their own per-room dicts clean up through these (see on_drop)
+_drop_hooks: List[Callable[[str], None]] = []
+
+
+# ─── Lifecycle ──────────────────────────────────────────
+def load_room(room_collection, room_id: str) -> Optional[Dict]:
+    """Pull the room document once and make memory authoritative for it."""
+    store = RoomStore(room_collection)
+    doc = store.game_view(room_id)
+    if not doc:
+        return None
+
+    terrain_id = doc.get("terrain_id")
+    terrain = load_terrain(terrain_id) if terrain_id else None
+    if terrain is None:
+        # rooms created before terrain blobs: move the nested list out of the document
+        terrain = doc.get("terrain") or [[0] * MAP_WIDTH for _ in range(MAP_HEIGHT)]
+        terrain_id = save_terrain(terrain)
+        store.set_terrain_id(room_id, terrain_id)
+    state = {
+        "id":             room_id,
+        "terrain":        terrain,
+        "terrain_id":     terrain_id,
+        "width":          len(terrain[0]),
+        "height":         len(terrain),
+        "collision":      maps_for(room_id, terrain),
+        "attacking_team": doc.get("attacking_team"),
+        "red_team":       list(doc.get("red_team", [])),
+        "blue_team":      list(doc.get("blue_team", [])),
+        "players": {
+            p["id"]: {
+                "x":         p["x"],
+                "y":         p["y"],
+                "team":      p.get("team"),
+                "is_tagger": p.get("is_tagger", False),
+            }
+            for p in doc.get("players", []) if p.get("id")
+        },
+        "inputs": {},
+        "grid":   SpatialGrid(len(terrain[0]), len(terrain)),
+        "seq":         0,
+        "history":     OrderedDict(),
+        "bin_clients": {},
+    }
+    state["slot_ids"] = list(state["players"])
+    for pid, p in state["players"].items():
+        state["grid"].insert(pid, p["x"], p["y"])
+
+    with rooms_lock:
+        rooms[room_id] = state
+    return state
+
+
+def get_room(room_id: str) -> Optional[Dict]:
+    return rooms.get(room_id)
+
+
+def on_drop(fn: Callable[[str], None]) -> Callable[[str], None]:
+    """Decorator: call fn(room_id) whenever a finished room is dropped."""
+    _drop_hooks.append(fn)
+    return fn
+
+
+def drop_room(room_id: str) -> None:
+    with rooms_lock:
+        rooms.pop(room_id, None)
+    drop_room_maps(room_id)
+    for hook in _drop_hooks:
+        hook(room_id)
+
+
+def remove_player(room_id: str, player: str) -> None:
+    state = rooms.get(room_id)
+    if not state:
+        return
+    with rooms_lock:
+        state["players"].pop(player, None)
+        state["inputs"].pop(player, None)
+        state["grid"].remove(player)
+
+
+# ─── Views ──────────────────────────────────────────────
+def players_list(state: Dict) -> List[Dict]:
+    """Players in the same shape as the Mongo `players` array."""
+    return [
+        {"id": pid, "x": p["x"], "y": p["y"],
+         "team": p.get("team"), "is_tagger": p.get("is_tagger", False)}
+        for pid, p in state["players"].items()
+    ]
+
+
+def team_sizes(state: Dict) -> Dict[str, int]:
+    sizes = {"red": 0, "blue": 0}
+    for p in state["players"].values():
+        if p.get("team") in sizes:
+            sizes[p["team"]] += 1
+    return sizes
+
+
+# ─── Round-boundary sync ────────────────────────────────
+def sync_room_to_db(room_collection, room_id: str) -> None:
+    """Write players + attacking_team back to the room document (one update)."""
+    state = rooms.get(room_id)
+    if not state:
+        return
+    with rooms_lock:
+        players = players_list(state)
+        attacking_team = state["attacking_team"]
+    RoomStore(room_collection).save_round(room_id, players, attacking_team)
@@ -0,0 +1,104 @@
+# util/inputs.py
+"""
+Input layer in front of the tick loop.
+
+Every `move` event passes through `submit_input`, which
+  • rate-limits per sid (token bucket, MAX_INPUTS_PER_SEC / INPUT_BURST),
+  • drops frames whose player / room aren't the ones this sid joined as
+    (util.sessions: the user bound on connect, the room from join_room),
+  • drops malformed payloads and frames with no arrow held,
+  • drops frames identical to the one already queued for this tick,
+and otherwise overwrites the player's pending key state, so each player
+contributes at most one input per tick (see util.simulation).
+"""
+
+import time
+from typing import Dict, Optional
+from eventlet.semaphore import Semaphore
+from util import game_state
+from util.sessions import sid_users, sid_rooms
+
+# ─── Tunables ────────────────────────────────────────────
+MAX_INPUTS_PER_SEC = 60       # sustained rate per sid (client sends ≤ 1 per frame)
+INPUT_BURST        = 20       # bucket size
+
+ARROW_KEYS = ('ArrowUp', 'ArrowDown', 'ArrowLeft', 'ArrowRight')
+
+# ─── Counters (exported by the metrics endpoint) ────────
+input_counters: Dict[str, int] = {
+    "accepted":          0,
+    "dropped_rate":      0,
+    "dropped_duplicate": 0,
+    "dropped_invalid":   0,
+}
+
+# ─── In-memory tracker:  sid → {"tokens": float, "last": monotonic} ──
+_buckets: Dict[str, Dict] = {}
+_lock = Semaphore()
+
+
+def submit_input(sid: str, room_id: str, player: str, direction) -> bool:
+    """Queue <direction> for <player>; returns False if the frame was dropped.
+
+    <room_id> / <player> come from the client and must match the sid's own.
+    """
+    if not _take_token(sid):
+        _count("dropped_rate")
+        return False
+
+    keys = _normalize(direction)
+    entry = sid_rooms.get(sid)
+    if (keys is None or not entry or entry[2] != '/battlefield'
+            or entry[0] != sid_users.get(sid) or (player, room_id) != entry[:2]):
+        _count("dropped_invalid")
+        return False
+
+    room = game_state.get_room(room_id)
+    if not room or player not in room['players']:
+        _count("dropped_invalid")
+        return False
+
+    with game_state.rooms_lock:
+        if room['inputs'].get(player) == keys:
+            duplicate = True
+        else:
+            duplicate = False
+            room['inputs'][player] = keys
+
+    _count("dropped_duplicate" if duplicate else "accepted")
+    return not duplicate
+
+
+def forget_sid(sid: str) -> None:
+    with _lock:
+        _buckets.pop(sid, None)
+
+
+# ─── Internal helpers ───────────────────────────────────
+def _normalize(direction) -> Optional[Dict[str, bool]]:
+    """Only the four arrow booleans survive; None if nothing usable is held."""
+    if not isinstance(direction, dict):
+        return None
+    keys = {k: bool(direction.get(k)) for k in ARROW_KEYS}
+    if not any(keys.values()):
+        return None
+    return keys
+
+
+def _take_token(sid: str) -> bool:
+    now = time.monotonic()
+    with _lock:
+        bucket = _buckets.get(sid)
+        if bucket is None:
+            bucket = _buckets[sid] = {"tokens": float(INPUT_BURST), "last": now}
+        bucket["tokens"] = min(INPUT_BURST,
+                               bucket["tokens"] + (now - bucket["last"]) * MAX_INPUTS_PER_SEC)
+        bucket["last"] = now
+        if bucket["tokens"] < 1:
+            return False
+        bucket["tokens"] -= 1
+        return True
+
+
+def _count(name: str) -> None:
+    input_counters[name] += 1
@@ -0,0 +1,50 @@
+# util/leaderboard.py
+"""
+Cached top-N leaderboard pages.
+
+Pages come straight from an index-backed sorted query (wins ↓, username ↑)
+and are kept in memory as ready-to-send JSON plus an ETag derived from
+the content.  `invalidate_leaderboard` is called when a match awards
+wins (util.rounds).  With several workers the match may end on another
+process, so pages there also age out after CLUSTER_CACHE_TTL seconds.
+(offset, limit) comes from the client, so at most LEADERBOARD_CACHE_PAGES
+pages are kept (least recently used goes first).
+"""
+
+import hashlib, json
+from typing import Tuple
+from util.cache import TTLCache
+from util.database import user_collection
+from util.cluster import CLUSTERED, CLUSTER_CACHE_TTL
+
+# ─── Tunables ────────────────────────────────────────────
+DEFAULT_LIMIT           = 50
+MAX_LIMIT               = 100
+LEADERBOARD_CACHE_PAGES = 32
+LEADERBOARD_CACHE_TTL   = 3600   # seconds; wins invalidate explicitly
+
+# ─── In-memory cache:  (offset, limit) → (json bytes, etag) ──
+_pages = TTLCache(maxsize=LEADERBOARD_CACHE_PAGES,
+                  ttl=CLUSTER_CACHE_TTL if CLUSTERED else LEADERBOARD_CACHE_TTL)
+
+
+def leaderboard_page(offset: int = 0, limit: int = DEFAULT_LIMIT) -> Tuple[bytes, str]:
+    offset = max(offset, 0)
+    limit  = min(max(limit, 1), MAX_LIMIT)
+
+    page = _pages.get((offset, limit))
+    if page is None:
+        cursor = (user_collection
+                  .find({}, {"_id": 0, "username": 1, "wins": 1})
+                  .sort([("wins", -1), ("username", 1)])
+                  .skip(offset)
+                  .limit(limit))
+        rows = [{"username": u["username"], "wins": u.get("wins", 0)} for u in cursor]
+        body = json.dumps(rows).encode()
+        page = (body, hashlib.sha1(body).hexdigest())
+        _pages.set((offset, limit), page)
+    return page
+
+
+def invalidate_leaderboard() -> None:
+    _pages.clear()
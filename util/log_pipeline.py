@@ -0,0 +1,134 @@
+# util/log_pipeline.py
+"""
+Non-blocking log pipeline for server.log and raw_http.log.
+
+Request handlers only put records on a queue (QueueHandler); a single
+QueueListener drains it and writes them in batches to size-rotated
+files, flushing once per batch instead of once per line.
+
+server.py monkey-patches eventlet first, so a plain QueueListener would
+run as a green thread and its disk writes would still stall the hub.
+The listener thread, its queue and the handler locks therefore come from
+eventlet.patcher.original(...): file I/O happens on a real OS thread.
+
+Env switches:
+    LOG_MAX_BYTES         rotate a log file at this size  (default 10 MB)
+    LOG_BACKUPS           rotated files kept               (default 5)
+    RAW_HTTP_BODIES       "false" → never capture bodies   (production)
+    RAW_HTTP_SAMPLE_RATE  0.0–1.0 share of requests written to raw_http.log
+
+With several workers (util/cluster.py) each one writes its own
+server.<worker>.log / raw_http.<worker>.log so rotations don't collide.
+"""
+
+import atexit, logging, os, random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from eventlet import patcher
+from util.cluster import CLUSTERED, WORKER_ID
+
+# un-patched modules: the writer runs on a native thread
+_threading = patcher.original('threading')
+_queue     = patcher.original('queue')
+
+# ─── Tunables ────────────────────────────────────────────
+LOG_DIR              = 'logs'
+LOG_FORMAT           = '%(asctime)s [%(levelname)s] %(message)s'
+LOG_DATEFMT          = '%Y-%m-%d %H:%M:%S'
+LOG_BATCH_SIZE       = 64
+LOG_MAX_BYTES        = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUPS          = int(os.environ.get('LOG_BACKUPS', 5))
+RAW_HTTP_BODIES      = os.environ.get('RAW_HTTP_BODIES', "true").lower() == "true"
+RAW_HTTP_SAMPLE_RATE = float(os.environ.get('RAW_HTTP_SAMPLE_RATE', 1.0))
+RAW_LOGGER           = 'raw'
+
+
+class BatchingFileHandler(RotatingFileHandler):
+    """Buffers formatted lines until the batch is full; NativeQueueListener
+    flushes every handler whenever the queue runs dry."""
+
+    def __init__(self, filename, batch_size=LOG_BATCH_SIZE, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self._batch   = batch_size
+        self._pending = []
+
+    def createLock(self):
+        # taken by the native listener thread – a green lock can't be
+        self.lock = _threading.RLock()
+
+    def emit(self, record):
+        try:
+            self._pending.append(self.format(record) + self.terminator)
+            if len(self._pending) >= self._batch:
+                self._write_pending()
+        except Exception:
+            self.handleError(record)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        self._pending.clear()
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and self.stream.tell() + len(data) >= self.maxBytes:
+            self.doRollover()
+            if self.stream is None:       # delay=True → doRollover leaves it closed
+                self.stream = self._open()
+        self.stream.write(data)
+        self.stream.flush()
+
+    def flush(self):
+        with self.lock:
+            self._write_pending()
+        super().flush()
+
+
+class NativeQueueListener(QueueListener):
+    """QueueListener whose monitor is an OS thread, not a green one."""
+
+    def start(self):
+        self._thread = t = _threading.Thread(target=self._monitor, daemon=True)
+        t.start()
+
+    def dequeue(self, block):
+        # about to wait: nothing buffered may sit behind the other handler's records
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+
+
+def setup_logging() -> QueueListener:
+    """Route the root logger and the raw HTTP logger through one queue."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_queue = _queue.Queue(-1)
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
+
+    suffix = f'.{WORKER_ID}.log' if CLUSTERED else '.log'
+    server_handler = BatchingFileHandler(os.path.join(LOG_DIR, 'server' + suffix),
+                                         maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    server_handler.addFilter(lambda r: r.name != RAW_LOGGER)
+    raw_handler = BatchingFileHandler(os.path.join(LOG_DIR, 'raw_http' + suffix),
+                                      maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    raw_handler.addFilter(lambda r: r.name == RAW_LOGGER)
+    for handler in (server_handler, raw_handler):
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+
+    raw = logging.getLogger(RAW_LOGGER)
+    raw.setLevel(logging.INFO)
+    raw.propagate = False
+    raw.addHandler(QueueHandler(log_queue))
+
+    listener = NativeQueueListener(log_queue, server_handler, raw_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def sample_raw_http() -> bool:
+    """Decide once per request whether it goes to raw_http.log."""
+    return RAW_HTTP_SAMPLE_RATE >= 1.0 or random.random() < RAW_HTTP_SAMPLE_RATE
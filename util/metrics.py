@@ -0,0 +1,272 @@
+# util/metrics.py
+"""
+Prometheus-style metrics, rendered in the text exposition format at
+/metrics (server.py).
+
+    socketio_events_total / _errors_total / _event_seconds   per (namespace, event)
+    mongo_commands_total / _failures_total / _command_seconds per (handler, command)
+    mongo_sent_bytes_total / _received_bytes_total            per (handler, command)
+    game_tick_seconds                                         one simulation tick
+    hub_loop_lag_seconds                                      eventlet hub delay
+    + gauges registered with `register_gauge` (rooms, players, timers, ...)
+
+Mongo commands are attributed to whatever is running in the current
+green thread: a socket handler ("/lobby:join_team"), a Flask view
+("http:auth.login"), a scheduled job ("job:_end_round") or the tick loop.
+Comparing handler time with the Mongo time charged to it is what tells a
+database bottleneck from a CPU one; the byte counters (BSON size of
+commands and replies) show which handlers fetch more than they use.
+The driver only hands listeners decoded documents, so sizing one means
+encoding it again: only 1 in MONGO_BYTE_SAMPLE commands / replies is
+measured, and counted ×MONGO_BYTE_SAMPLE (an estimate; 0 turns the byte
+counters off, 1 measures everything at one extra encode per round trip).
+
+Socket handlers opt in by registering through `on` instead of
+`socketio.on`:
+
+    @metrics.on(socketio, 'join_team', namespace='/lobby')
+"""
+
+import bisect, functools, inspect, os, random, time
+import bson
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+import eventlet
+from eventlet.corolocal import local
+from eventlet.semaphore import Semaphore
+from pymongo import monitoring
+from util import profiling
+
+# ─── Tunables ────────────────────────────────────────────
+LATENCY_BUCKETS   = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+HUB_LAG_INTERVAL  = 0.5           # seconds between hub-lag probes
+IDLE_HANDLER      = 'background'  # Mongo calls made outside any labelled handler
+MONGO_BYTE_SAMPLE = int(os.environ.get('MONGO_BYTE_SAMPLE', 16))   # size 1 in N, see above
+
+_registry: List["_Metric"] = []
+_lock = Semaphore()
+_current = local()                # per green thread
+
+
+# ─── Metric types ───────────────────────────────────────
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[Tuple, object] = {}
+        _registry.append(self)
+
+    def _label_str(self, values: Tuple, extra: str = '') -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def lines(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def lines(self):
+        for values, total in sorted(self._values.items()):
+            yield f"{self.name}{self._label_str(values)} {total:g}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values) -> None:
+        with _lock:
+            h = self._values.get(label_values)
+            if h is None:
+                h = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][bisect.bisect_left(self.buckets, value)] += 1
+            h[1] += value
+            h[2] += 1
+
+    def lines(self):
+        for values, (counts, total, n) in sorted(self._values.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else f'{bound:g}')
+                yield f"{self.name}_bucket{self._label_str(values, le)} {running}"
+            yield f"{self.name}_sum{self._label_str(values)} {total:.6f}"
+            yield f"{self.name}_count{self._label_str(values)} {n}"
+
+
+class Gauge(_Metric):
+    """Read at scrape time: fn() → number, or {label values tuple: number}.
+
+    kind='counter' exposes a running total kept elsewhere (util.inputs).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn: Callable, labels=(), kind: str = 'gauge'):
+        super().__init__(name, help, labels)
+        self.fn, self.kind = fn, kind
+
+    def lines(self):
+        value = self.fn()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for values, v in sorted(items):
+            yield f"{self.name}{self._label_str(values)} {v:g}"
+
+
+def register_gauge(name: str, help: str, fn: Callable,
+                   labels: Tuple[str, ...] = (), kind: str = 'gauge') -> Gauge:
+    return Gauge(name, help, fn, labels, kind)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+# ─── Built-in metrics ───────────────────────────────────
+socket_events  = Counter('socketio_events_total', 'Socket.IO events handled', ('namespace', 'event'))
+socket_errors  = Counter('socketio_event_errors_total', 'Socket.IO handlers that raised', ('namespace', 'event'))
+socket_seconds = Histogram('socketio_event_seconds', 'Socket.IO handler wall time', ('namespace', 'event'))
+mongo_commands = Counter('mongo_commands_total', 'MongoDB commands issued', ('handler', 'command'))
+mongo_failures = Counter('mongo_command_failures_total', 'MongoDB commands that failed', ('handler', 'command'))
+mongo_seconds  = Histogram('mongo_command_seconds', 'MongoDB command round-trip time', ('handler', 'command'))
+mongo_sent     = Counter('mongo_sent_bytes_total', 'BSON bytes of MongoDB commands sent (sampled estimate)',
+                         ('handler', 'command'))
+mongo_received = Counter('mongo_received_bytes_total', 'BSON bytes of MongoDB replies received (sampled estimate)',
+                         ('handler', 'command'))
+tick_seconds   = Histogram('game_tick_seconds', 'One battlefield simulation tick (all work for a room)')
+hub_lag        = Histogram('hub_loop_lag_seconds', 'How late the eventlet hub woke a sleeping green thread',
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+_hub_lag_last  = [0.0]
+register_gauge('hub_loop_lag_last_seconds', 'Most recent hub-lag probe', lambda: _hub_lag_last[0])
+
+
+# ─── Handler attribution ────────────────────────────────
+def current_handler() -> str:
+    return getattr(_current, 'handler', IDLE_HANDLER)
+
+
+def set_handler(name: str) -> None:
+    """Label the current green thread (Flask before/teardown_request)."""
+    _current.handler = name
+
+
+@contextmanager
+def handler(name: str):
+    """Charge Mongo commands issued inside the block to <name>."""
+    previous = getattr(_current, 'handler', IDLE_HANDLER)
+    _current.handler = name
+    try:
+        yield
+    finally:
+        _current.handler = previous
+
+
+def on(socketio, event: str, namespace: str = None):
+    """Drop-in for @socketio.on(event, namespace=...) that counts and times the
+    handler (and profiles the calls util.profiling samples)."""
+    namespace = namespace or '/'
+    label = (namespace, event)
+    name  = f"{namespace}:{event}"
+
+    def decorator(fn):
+        arity = _positional_arity(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            start = time.perf_counter()
+            with handler(name):
+                try:
+                    # connect gets (auth), disconnect may get (reason): pass what fn takes
+                    return profiling.call(name, fn, *(args[:arity] if arity is not None else args))
+                except Exception:
+                    socket_errors.inc(*label)
+                    raise
+                finally:
+                    socket_events.inc(*label)
+                    socket_seconds.observe(time.perf_counter() - start, *label)
+
+        return socketio.on(event, namespace=namespace)(wrapper)
+    return decorator
+
+
+def _positional_arity(fn):
+    params = inspect.signature(fn).parameters.values()
+    if any(p.kind == p.VAR_POSITIONAL for p in params):
+        return None
+    return sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+
+# ─── MongoDB ────────────────────────────────────────────
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Passed to MongoClient(event_listeners=[...]) in util.database."""
+
+    def started(self, event):
+        _count_bytes(mongo_sent, event.command_name, event.command)
+
+    def succeeded(self, event):
+        _count_bytes(mongo_received, event.command_name, event.reply)
+        self._record(event)
+
+    def failed(self, event):
+        mongo_failures.inc(current_handler(), event.command_name)
+        self._record(event)
+
+    @staticmethod
+    def _record(event):
+        labels = (current_handler(), event.command_name)
+        mongo_commands.inc(*labels)
+        mongo_seconds.observe(event.duration_micros / 1e6, *labels)
+
+
+def _count_bytes(counter: Counter, command: str, doc) -> None:
+    if MONGO_BYTE_SAMPLE <= 0 or not doc or random.random() * MONGO_BYTE_SAMPLE >= 1:
+        return
+    try:
+        size = len(bson.encode(doc))
+    except (bson.errors.BSONError, TypeError):
+        return
+    counter.inc(current_handler(), command, amount=size * MONGO_BYTE_SAMPLE)
+
+
+# ─── Eventlet hub lag ───────────────────────────────────
+_hub_monitor = None
+
+
+def start_hub_monitor() -> None:
+    """A green thread that sleeps HUB_LAG_INTERVAL and records the overshoot."""
+    global _hub_monitor
+    if _hub_monitor is None:
+        _hub_monitor = eventlet.spawn(_watch_hub)
+
+
+def _watch_hub() -> None:
+    while True:
+        start = time.monotonic()
+        eventlet.sleep(HUB_LAG_INTERVAL)
+        lag = max(time.monotonic() - start - HUB_LAG_INTERVAL, 0.0)
+        _hub_lag_last[0] = lag
+        hub_lag.observe(lag)
+
+
+# ─── Exposition ─────────────────────────────────────────
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def render() -> str:
+    out = []
+    for metric in _registry:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.lines())
+    return '\n'.join(out) + '\n'
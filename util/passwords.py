@@ -0,0 +1,40 @@
+# util/passwords.py
+"""
+bcrypt hashing off the eventlet hub.
+
+bcrypt is CPU-bound C/Rust code; called inline it stalls every socket and
+game tick on the process for the whole hash.  Here it runs in eventlet's
+native thread pool (tpool, which releases the hub while it waits), with
+at most BCRYPT_MAX_CONCURRENCY hashes in flight so a login burst can't
+take every pool thread.
+
+Env switches:
+    BCRYPT_ROUNDS           work factor for new hashes (default 12)
+    BCRYPT_MAX_CONCURRENCY  simultaneous hashes          (default 4)
+"""
+
+import os
+import bcrypt
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+
+# ─── Tunables ────────────────────────────────────────────
+BCRYPT_ROUNDS          = int(os.environ.get('BCRYPT_ROUNDS', 12))
+BCRYPT_MAX_CONCURRENCY = int(os.environ.get('BCRYPT_MAX_CONCURRENCY', 4))
+
+_slots = Semaphore(BCRYPT_MAX_CONCURRENCY)
+
+
+def hash_password(password: str) -> str:
+    with _slots:
+        return tpool.execute(_hash, password.encode()).decode()
+
+
+def check_password(password: str, hashed: str) -> bool:
+    # existing hashes keep the work factor they were created with
+    with _slots:
+        return tpool.execute(bcrypt.checkpw, password.encode(), hashed.encode())
+
+
+def _hash(password: bytes) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
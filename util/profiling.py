@@ -0,0 +1,211 @@
+# util/profiling.py
+"""
+Opt-in, sampled per-handler profiling with flame-graph output.
+
+A sampled call runs under a sys.setprofile hook that follows only the
+green thread making the call and charges wall time (own time, minus
+children) to the full call stack.  Totals are merged per handler and
+written every PROFILE_FLUSH_SEC to
+
+    logs/profiles/<handler>.<worker>.folded      "frame;frame;frame <µs>"
+
+which flamegraph.pl, speedscope or inferno read directly.  Time a call
+spends parked on I/O (e.g. waiting for Mongo) shows up under the frame
+that yielded, so slow queries are visible next to CPU work.
+
+Handlers are named like util.metrics labels ("/battlefield:move",
+"http:auth.login"); a rate can target the full name, the bare event
+("move") or "*":
+
+    PROFILE_SAMPLE_RATES="move=0.01,join_team=1,http:auth.login=0.1"
+
+Rates can also be changed at runtime through /admin/profiling (server.py).
+
+Env switches:
+    PROFILE_SAMPLE_RATES   see above                         (default: off)
+    PROFILE_MAX_SAMPLES    stop sampling a handler after N   (default 1000)
+    PROFILE_FLUSH_SEC      folded-file rewrite interval      (default 10 s)
+"""
+
+import os, random, re, sys, sysconfig, time
+from collections import Counter
+from typing import Dict
+import eventlet
+import greenlet
+from eventlet.semaphore import Semaphore
+from util.cluster import WORKER_ID
+
+# ─── Tunables ────────────────────────────────────────────
+PROFILE_DIR         = os.path.join('logs', 'profiles')
+PROFILE_MAX_SAMPLES = int(os.environ.get('PROFILE_MAX_SAMPLES', 1000))
+PROFILE_FLUSH_SEC   = float(os.environ.get('PROFILE_FLUSH_SEC', 10))
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """ "move=0.01,join_team=1" → {"move": 0.01, "join_team": 1.0} """
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, rate = item.rpartition('=')
+        rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+# ─── Global memory ──────────────────────────────────────
+sample_rates: Dict[str, float] = parse_rates(os.environ.get('PROFILE_SAMPLE_RATES', ''))
+samples_taken: Counter = Counter()                 # handler → sampled calls
+_stacks: Dict[str, Counter] = {}                   # handler → {folded stack: seconds}
+_active: Dict[greenlet.greenlet, "_Trace"] = {}    # green thread → its running trace
+_dirty = set()
+_lock = Semaphore()
+_flusher = None
+
+
+def set_rates(rates: Dict[str, float]) -> None:
+    """Replace the sampling table (admin endpoint); counts start over."""
+    with _lock:
+        sample_rates.clear()
+        sample_rates.update({k: min(max(float(v), 0.0), 1.0) for k, v in rates.items()})
+        samples_taken.clear()
+
+
+def rate_for(name: str) -> float:
+    if not sample_rates:
+        return 0.0
+    event = name.rsplit(':', 1)[-1]
+    return sample_rates.get(name, sample_rates.get(event, sample_rates.get('*', 0.0)))
+
+
+# ─── Public entry-points ────────────────────────────────
+def call(name: str, fn, *args, **kwargs):
+    """fn(*args, **kwargs), profiled if this call is sampled for <name>."""
+    rate = rate_for(name)
+    if (rate <= 0.0 or samples_taken[name] >= PROFILE_MAX_SAMPLES
+            or (rate < 1.0 and random.random() >= rate)):
+        return fn(*args, **kwargs)
+
+    samples_taken[name] += 1
+    trace = _Trace(name)
+    _start(trace)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _stop(trace)
+        _merge(trace)
+
+
+def wrap_views(app) -> None:
+    """Route every Flask view through `call` as "http:<endpoint>"."""
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint == 'static':
+            continue
+        app.view_functions[endpoint] = _wrap_view(f"http:{endpoint}", view)
+
+
+def _wrap_view(name, view):
+    def profiled_view(*args, **kwargs):
+        return call(name, view, *args, **kwargs)
+    profiled_view.__name__ = view.__name__
+    profiled_view.__wrapped__ = view
+    return profiled_view
+
+
+# ─── Tracing ────────────────────────────────────────────
+class _Trace:
+    __slots__ = ("name", "stack", "folded")
+
+    def __init__(self, name: str):
+        self.name   = name
+        self.stack  = []          # [label, started, child time]
+        self.folded = Counter()   # "a;b;c" → seconds
+
+
+# _active is only touched between green-thread switches, and the hook must
+# be the last / first thing these do so none of it lands in the trace.
+def _start(trace: _Trace) -> None:
+    _active[greenlet.getcurrent()] = trace
+    if len(_active) == 1:
+        sys.setprofile(_on_event)
+
+
+def _stop(trace: _Trace) -> None:
+    _active.pop(greenlet.getcurrent(), None)
+    if not _active:
+        sys.setprofile(None)
+    trace.stack.clear()           # just _stop's own frame
+
+
+def _on_event(frame, event, arg):
+    trace = _active.get(greenlet.getcurrent())
+    if trace is None:
+        return
+    now = time.perf_counter()
+    if event == 'call':
+        code = frame.f_code
+        trace.stack.append([f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})", now, 0.0])
+    elif event == 'c_call':
+        trace.stack.append([getattr(arg, '__qualname__', None) or getattr(arg, '__name__', 'builtin'), now, 0.0])
+    elif trace.stack:             # return / c_return / c_exception
+        _pop(trace, now)
+
+
+def _pop(trace: _Trace, now: float) -> None:
+    label, started, child = trace.stack[-1]
+    elapsed = now - started
+    trace.folded[';'.join([trace.name] + [f[0] for f in trace.stack])] += elapsed - child
+    trace.stack.pop()
+    if trace.stack:
+        trace.stack[-1][2] += elapsed
+
+
+_ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_STDLIB = sysconfig.get_paths()['stdlib'] + os.sep
+_SITE   = re.compile(r'.*[/\\](site|dist)-packages[/\\]')
+
+
+def _short(path: str) -> str:
+    """util/rooms.py, flask/app.py, stdlib/json/encoder.py ..."""
+    if path.startswith(_ROOT):
+        return path[len(_ROOT):]
+    path = _SITE.sub('', path)
+    return 'stdlib/' + path[len(_STDLIB):] if path.startswith(_STDLIB) else path
+
+
+# ─── Output ─────────────────────────────────────────────
+def _merge(trace: _Trace) -> None:
+    global _flusher
+    with _lock:
+        totals = _stacks.setdefault(trace.name, Counter())
+        totals.update(trace.folded)
+        _dirty.add(trace.name)
+        if _flusher is None:
+            _flusher = eventlet.spawn(_flush_forever)
+
+
+def _flush_forever() -> None:
+    while True:
+        eventlet.sleep(PROFILE_FLUSH_SEC)
+        flush()
+
+
+def flush() -> None:
+    """Rewrite the folded file of every handler sampled since the last flush."""
+    with _lock:
+        snapshot = {name: dict(_stacks[name]) for name in _dirty}
+        _dirty.clear()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    for name, stacks in snapshot.items():
+        path = os.path.join(PROFILE_DIR, f"{_file_safe(name)}.{WORKER_ID}.folded")
+        with open(path, 'w') as f:
+            for stack, seconds in sorted(stacks.items()):
+                micros = int(seconds * 1e6)
+                if micros > 0:
+                    f.write(f"{stack} {micros}\n")
+
+
+def _file_safe(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+
+
+def status() -> Dict:
+    return {"rates": dict(sample_rates), "samples": dict(samples_taken),
+            "max_samples": PROFILE_MAX_SAMPLES, "dir": PROFILE_DIR}
@@ -0,0 +1,177 @@
+# util/room_store.py
+"""
+Typed access to the `rooms` collection.
+
+Every read asks MongoDB for the fields its caller uses and nothing else,
+so checking the owner or redrawing the team lists no longer pulls the
+players array (or, for rooms from before util.terrain blobs, the whole
+terrain) over the wire and through the BSON decoder.  New call sites
+should add a method here rather than calling the collection directly;
+util.metrics charges the bytes each command moves to the handler that
+issued it (mongo_*_bytes_total), which shows what a projection saves.
+
+    store = RoomStore(room_collection)
+    store.owner(room_id)          → "alice" / None
+    store.teams(room_id)          → {"red_team": [...], "blue_team": [...], "no_team": [...]}
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple, TypedDict
+from pymongo import ReturnDocument
+
+TEAM_FIELDS = ("red_team", "blue_team", "no_team")
+
+
+class RoomTeams(TypedDict, total=False):
+    red_team:  List[str]
+    blue_team: List[str]
+    no_team:   List[str]
+
+
+class RoomPlayer(TypedDict, total=False):
+    id:        str
+    x:         float
+    y:         float
+    team:      str
+    is_tagger: bool
+
+
+class JoinView(TypedDict, total=False):
+    """What a battlefield join needs: avatars (teams) + players + terrain."""
+    red_team:   List[str]
+    blue_team:  List[str]
+    players:    List[RoomPlayer]
+    terrain_id: str
+
+
+class StartView(TypedDict, total=False):
+    owner:        str
+    game_started: bool
+    red_team:     List[str]
+    blue_team:    List[str]
+    players:      List[RoomPlayer]
+
+
+class GameView(TypedDict, total=False):
+    """Everything util.game_state.load_room copies into memory."""
+    red_team:       List[str]
+    blue_team:      List[str]
+    players:        List[RoomPlayer]
+    attacking_team: Optional[str]
+    terrain_id:     str
+    terrain:        List[List[int]]   # only on rooms created before terrain blobs
+
+
+def _fields(*names: str) -> Dict[str, int]:
+    projection = {"_id": 0}
+    projection.update((name, 1) for name in names)
+    return projection
+
+
+TEAM_PROJECTION  = _fields(*TEAM_FIELDS)
+JOIN_PROJECTION  = _fields("red_team", "blue_team", "players", "terrain_id")
+START_PROJECTION = _fields("owner", "game_started", "red_team", "blue_team", "players")
+GAME_PROJECTION  = _fields("red_team", "blue_team", "players", "attacking_team", "terrain_id", "terrain")
+
+
+def team_switch_pipeline(username: str, team_field: str) -> List[Dict]:
+    """Pipeline update: drop <username> from every team array, append it to
+    <team_field>.  Runs server-side in one atomic find_one_and_update."""
+    # a name starting with "$" must not be read as a field path
+    me = {"$literal": username} if username.startswith("$") else username
+    stage = {}
+    for field in TEAM_FIELDS:
+        kept = {"$filter": {"input": {"$ifNull": [f"${field}", []]},
+                            "cond": {"$ne": ["$$this", me]}}}
+        stage[field] = {"$concatArrays": [kept, [me]]} if field == team_field else kept
+    return [{"$set": stage}]
+
+
+class RoomStore:
+    __slots__ = ("collection",)
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    # ─── Reads ──────────────────────────────────────────
+    def _field(self, room_id: str, name: str):
+        doc = self.collection.find_one({"id": room_id}, _fields(name))
+        return doc.get(name) if doc else None
+
+    def owner(self, room_id: str) -> Optional[str]:
+        return self._field(room_id, "owner")
+
+    def name(self, room_id: str) -> Optional[str]:
+        return self._field(room_id, "room_name")
+
+    def players(self, room_id: str) -> List[RoomPlayer]:
+        return self._field(room_id, "players") or []
+
+    def teams(self, room_id: str) -> Optional[RoomTeams]:
+        return self.collection.find_one({"id": room_id}, TEAM_PROJECTION)
+
+    def join_view(self, room_id: str) -> Optional[JoinView]:
+        return self.collection.find_one({"id": room_id}, JOIN_PROJECTION)
+
+    def start_view(self, room_id: str) -> Optional[StartView]:
+        return self.collection.find_one({"id": room_id}, START_PROJECTION)
+
+    def game_view(self, room_id: str) -> Optional[GameView]:
+        return self.collection.find_one({"id": room_id}, GAME_PROJECTION)
+
+    def open_rooms(self) -> Iterator[Tuple[str, str]]:
+        """(room_id, room_name) of every room that hasn't started, oldest first."""
+        for doc in self.collection.find({"game_started": False}, _fields("id", "room_name")):
+            yield str(doc["id"]), doc["room_name"]
+
+    # ─── Lobby writes (each returns the teams afterwards) ──
+    def add_to_lobby(self, room_id: str, username: str) -> Optional[RoomTeams]:
+        """Newcomers land in no_team; the filter makes it a no-op otherwise."""
+        return self.collection.find_one_and_update(
+            {"id": room_id, "red_team": {"$ne": username},
+             "blue_team": {"$ne": username}, "no_team": {"$ne": username}},
+            {"$push": {"no_team": username}},
+            projection=TEAM_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        ) or self.teams(room_id)
+
+    def switch_team(self, room_id: str, username: str, team_field: str) -> Optional[RoomTeams]:
+        return self.collection.find_one_and_update(
+            {"id": room_id},
+            team_switch_pipeline(username, team_field),
+            projection=TEAM_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def leave_teams(self, room_id: str, username: str) -> Optional[RoomTeams]:
+        return self.collection.find_one_and_update(
+            {"id": room_id},
+            {"$pull": {field: username for field in TEAM_FIELDS}},
+            projection=TEAM_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    # ─── Lifecycle writes ───────────────────────────────
+    def create(self, room: Dict) -> None:
+        self.collection.insert_one(room)
+
+    def start(self, room_id: str, new_players: List[RoomPlayer]) -> None:
+        self.collection.update_one(
+            {"id": room_id},
+            {"$push": {"players": {"$each": new_players}},
+             "$set": {"game_started": True}}
+        )
+
+    def set_terrain_id(self, room_id: str, terrain_id: str) -> None:
+        """Move a pre-blob room over to its terrain_id (util.game_state)."""
+        self.collection.update_one({"id": room_id},
+                                   {"$set": {"terrain_id": terrain_id}, "$unset": {"terrain": ""}})
+
+    def save_round(self, room_id: str, players: List[RoomPlayer], attacking_team: Optional[str]) -> None:
+        self.collection.update_one({"id": room_id},
+                                   {"$set": {"players": players, "attacking_team": attacking_team}})
+
+    def remove_player(self, room_id: str, username: str) -> None:
+        self.collection.update_one({"id": room_id}, {"$pull": {"players": {"id": username}}})
+
+    def delete(self, room_id: str) -> None:
+        self.collection.delete_one({"id": room_id})
@@ -1,21 +1,43 @@
 import uuid
 import html
+import time
+from collections import OrderedDict
+from itertools import islice
 
 from flask_socketio import emit, join_room
 from flask import request
-from util.auth import hash_token
+from util.sessions import socket_user, bind_sid, unbind_sid, track_sid, untrack_sid
 from bson import ObjectId
 from util.rounds import kick_off_round_system
-
-
-connected_users = {}
-
-def choose_avatar(username, room_doc, user_doc):
+from util.simulation import run_room_ticks
+from util.users import get_user, get_users
+from util.terrain import save_terrain
+from util import metrics, game_state
+from util.cluster import owns_room, CLUSTERED, CLUSTER_CACHE_TTL
+from util.room_store import RoomStore
+
+
+# Open (not started) rooms in creation order: room_id → escaped name.
+# Hydrated from Mongo once, then kept in step by create_room / start_game.
+# With several workers it is re-read every CLUSTER_CACHE_TTL seconds, since
+# rooms created / started elsewhere only reach this process as emits.
+open_rooms = OrderedDict()
+open_rooms_loaded = 0.0          # monotonic time of the last hydrate (0 → never)
+ROOM_PAGE_SIZE = 50
+starting_rooms = set()          # rooms whose start_game is in progress
+ROOM_LIST_GROUP = 'room_list'   # sockets currently looking at the room list
+
+TEAM_FOR_CHOICE = {"red": "red_team", "blue": "blue_team"}   # anything else → no_team
+
+def choose_avatar(username, room_doc, user_doc=None):
     """
     Return an avatar filename (no leading /static/ part).
     • If the user uploaded one (user_doc["avatar"]), use it.
     • Otherwise return team default PNG.
+    user_doc defaults to the cached profile (util.users).
     """
+    if user_doc is None:
+        user_doc = get_user(username) or {}
     if user_doc.get("avatar"):
         return user_doc["avatar"]
     if username in room_doc["red_team"]:
@@ -24,36 +46,47 @@ def choose_avatar(username, room_doc, user_doc):
         return "defaultBlueTeamPNG.png"
 
 
-def register_room_handlers(socketio, user_collection, room_collection):
+def _int_arg(data, key, default):
+    """data[key] as an int; <default> for a missing, non-numeric or non-dict payload."""
+    if not isinstance(data, dict):
+        return default
+    try:
+        return int(data.get(key, default))
+    except (TypeError, ValueError, OverflowError):
+        return default
 
-    def _emit_team_counts(room_id: str):
-        """
-        Broadcast {"red": <int>, "blue": <int>} to everyone in <room_id>.
-        """
-        room = room_collection.find_one(
-            {"id": room_id},
-            {"red_team": 1, "blue_team": 1, "_id": 0}
-        )
-        if not room:
-            return
 
-        socketio.emit(
-            'team_counts',
-            {
-                "red": len(room.get("red_team", [])),
-                "blue": len(room.get("blue_team", [])),
-            },
-            room=room_id,
-            namespace='/lobby'
-        )
-
-    @socketio.on('create_room', namespace='/lobby')
-    def handle_create_room(room_name):
-        auth_token = request.cookies.get('auth_token')
-        if not auth_token:
-            return
+def lobby_state(room_doc):
+    """Everything the team-select page shows, as one `lobby_state` payload."""
+    red, blue = room_doc.get("red_team", []), room_doc.get("blue_team", [])
+    return {
+        "red_team": red,
+        "blue_team": blue,
+        "no_team": room_doc.get("no_team", []),
+        "counts": {"red": len(red), "blue": len(blue)},
+    }
+
 
-        user = user_collection.find_one({'auth_token': hash_token(auth_token)})
+def register_room_handlers(socketio, user_collection, room_collection):
+    room_store = RoomStore(room_collection)
+
+    def _emit_lobby_state(room_id: str, room_doc):
+        """One event with both team lists, the unassigned list and the counts."""
+        socketio.emit('lobby_state', lobby_state(room_doc), room=room_id, namespace='/lobby')
+
+    def _open_rooms():
+        global open_rooms_loaded
+        stale = CLUSTERED and time.monotonic() - open_rooms_loaded > CLUSTER_CACHE_TTL
+        if not open_rooms_loaded or stale:
+            open_rooms.clear()
+            for room_id, room_name in room_store.open_rooms():
+                open_rooms[room_id] = html.escape(room_name)
+            open_rooms_loaded = time.monotonic()
+        return open_rooms
+
+    @metrics.on(socketio, 'create_room', namespace='/lobby')
+    def handle_create_room(room_name):
+        user = socket_user()
         if not user:
             return
 
@@ -62,6 +95,7 @@ def register_room_handlers(socketio, user_collection, room_collection):
 
         # 🔥 Generate randomized terrain
         generated_terrain = generate_battlefield_terrain()
+        terrain_id = save_terrain(generated_terrain)   # packed blob, stored once per layout
 
         new_room = {
             "id": room_id,
@@ -72,166 +106,135 @@ def register_room_handlers(socketio, user_collection, room_collection):
             "no_team": [],
             "players": [],
             "game_started": False,
-            "terrain": generated_terrain  # 🔥 store it in MongoDB
+            "terrain_id": terrain_id  # 🔥 blob lives in the terrains collection
         }
-        room_collection.insert_one(new_room)
+        room_store.create(new_room)
+
+        # ➕ only the new room goes out, to clients viewing the list
+        name = html.escape(room_name)
+        _open_rooms()[room_id] = name
+        socketio.emit('room_added', {"id": room_id, "name": name},
+                      room=ROOM_LIST_GROUP, namespace='/lobby')
 
-        all_rooms = [
-            {"id": str(room["id"]), "name": html.escape(room["room_name"])}
-            for room in room_collection.find({"game_started": False})
-        ]
-        emit('room_list', all_rooms, broadcast=True)
 
+    @metrics.on(socketio, 'get_rooms', namespace='/lobby')
+    def handle_get_rooms(data=None):
+        """Page of open rooms: {"offset": int, "limit": int} → room_list."""
+        offset = max(_int_arg(data, 'offset', 0), 0)
+        limit = min(max(_int_arg(data, 'limit', ROOM_PAGE_SIZE), 1), ROOM_PAGE_SIZE)
 
-    @socketio.on('get_rooms', namespace='/lobby')
-    def handle_get_rooms():
-        all_rooms = [
-            {"id": str(room["id"]), "name": html.escape(room["room_name"])}
-            for room in room_collection.find({"game_started": False})
+        rooms = _open_rooms()
+        page = [
+            {"id": room_id, "name": name}
+            for room_id, name in islice(rooms.items(), offset, offset + limit)
         ]
-        emit('room_list', all_rooms)
+        emit('room_list', {"rooms": page, "offset": offset, "total": len(rooms)})
 
-    @socketio.on('join_room', namespace='/lobby')
+    @metrics.on(socketio, 'join_room', namespace='/lobby')
     def handle_join_room(data):
         room_id = data.get('room_id')  # or 'roomId' depending on your frontend
 
         join_room(room_id)
 
-    @socketio.on('page_ready', namespace='/lobby')
+    @metrics.on(socketio, 'page_ready', namespace='/lobby')
     def handle_page_ready(data):
         room_id = data.get('room_id')
         page = data.get('page')
         if page == 'create_lobby':
+            join_room(ROOM_LIST_GROUP)
             handle_get_rooms()
             return
 
         if page == 'team_select' and room_id:
-            auth_token = request.cookies.get('auth_token')
-            user = user_collection.find_one({'auth_token': hash_token(auth_token)})
+            user = socket_user()
             if not user:
                 return
 
             username = user['username']
 
-            # 🔥 Disconnect cleanup for the same user (see next section)
-            for sid, name in list(connected_users.items()):
-                if name == username:
-                    connected_users.pop(sid)
-
-            connected_users[request.sid] = username
+            # 🗂️ sid → (user, room): disconnect cleans up from this alone;
+            # an older sid of the same user (other tab) stops counting
+            track_sid(request.sid, username, room_id, '/lobby')
             join_room(room_id)  # <-- 🔥 this is the missing key!
 
-            room = room_collection.find_one({"id": room_id})
-            if not room:
+            # ➕ newcomers land in no_team (no-op if already on a list)
+            updated = room_store.add_to_lobby(room_id, username)
+            if not updated:
                 return
 
-            if username not in room["red_team"] + room["blue_team"] + room["no_team"]:
-                room_collection.update_one(
-                    {"id": room_id},
-                    {"$push": {"no_team": username}}
-                )
-
-            updated = room_collection.find_one({"id": room_id})
-            emit('team_red_list', updated["red_team"], room=room_id)
-            emit('team_blue_list', updated["blue_team"], room=room_id)
-            emit('no_team_list', updated["no_team"], room=room_id)
-            _emit_team_counts(room_id)
+            _emit_lobby_state(room_id, updated)
 
-    @socketio.on('join_team', namespace='/lobby')
+    @metrics.on(socketio, 'join_team', namespace='/lobby')
     def handle_join_team(data):
         team = data.get('team')
         room_id = data.get('room_id')
 
-        auth_token = request.cookies.get('auth_token')
-        if not auth_token:
-            return
-
-        user = user_collection.find_one({'auth_token': hash_token(auth_token)})
+        user = socket_user()
         if not user:
             return
 
         username = user['username']
-        room = room_collection.find_one({"id": room_id})
-        if not room:
-            return
-
 
-        # Remove from all teams
-        room_collection.update_one(
-            {"id": room_id},
-            {"$pull": {
-                "red_team": username,
-                "blue_team": username,
-                "no_team": username
-            }}
-        )
-
-        # Add to selected team
-        if team == "red":
-            room_collection.update_one({"id": room_id}, {"$push": {"red_team": username}})
-        elif team == "blue":
-            room_collection.update_one({"id": room_id}, {"$push": {"blue_team": username}})
-        else:
-            room_collection.update_one({"id": room_id}, {"$push": {"no_team": username}})
+        # ⚛️ leave every team + join the chosen one: one atomic round trip,
+        # so concurrent joiners can't interleave a $pull with a $push
+        updated = room_store.switch_team(room_id, username, TEAM_FOR_CHOICE.get(team, "no_team"))
+        if not updated:
+            return
 
         # Ensure socket joins the room
         join_room(room_id)
 
-        # Emit updated teams
-        updated = room_collection.find_one({"id": room_id})
-        emit('team_red_list', updated["red_team"], room=room_id)
-        emit('team_blue_list', updated["blue_team"], room=room_id)
-        emit('no_team_list', updated["no_team"], room=room_id)
         emit('joined_team', {'room_id': room_id, 'team': team}, to=request.sid)
-        _emit_team_counts(room_id)
-    @socketio.on('am_i_owner', namespace='/lobby')
+        _emit_lobby_state(room_id, updated)
+    @metrics.on(socketio, 'am_i_owner', namespace='/lobby')
     def handle_am_i_owner(data):
         room_id = data.get('room_id')
-        auth_token = request.cookies.get('auth_token')
-
-        if not auth_token:
-            emit('owner_status', {'is_owner': False})
-            return
-
-        user = user_collection.find_one({'auth_token': hash_token(auth_token)})
+        user = socket_user()
         if not user:
             emit('owner_status', {'is_owner': False})
             return
 
         username = user['username']
-        room = room_collection.find_one({'id': room_id})
+        owner = room_store.owner(room_id)   # just the owner field
 
-        if not room:
+        if not owner:
             emit('owner_status', {'is_owner': False})
             return
 
-        if username == room.get('owner'):
+        if username == owner:
             emit('owner_status', {'is_owner': True})
         else:
             emit('owner_status', {'is_owner': False})
 
-    @socketio.on('start_game', namespace='/lobby')
+    @metrics.on(socketio, 'start_game', namespace='/lobby')
     def handle_start_game(data):
         room_id = data.get('room_id')
 
-        auth_token = request.cookies.get('auth_token')
-        if not auth_token:
-            return
-
-        user = user_collection.find_one({'auth_token': hash_token(auth_token)})
+        user = socket_user()
         if not user:
             return
 
         username = user['username']
 
-        room = room_collection.find_one({'id': room_id})
+        room = room_store.start_view(room_id)
         if not room:
             return
 
         if username != room.get('owner'):
             return  # ❌ Only owner can start
 
+        # ❌ already running (double click / re-emit): a second load would reset
+        # the live state and a second tick loop would double movement speed.
+        # No yield between the check and the add, so this is atomic.
+        if room.get('game_started') or room_id in starting_rooms or game_state.get_room(room_id):
+            return
+        starting_rooms.add(room_id)
+        try:
+            _start_room(room_id, room)
+        finally:
+            starting_rooms.discard(room_id)
 
+    def _start_room(room_id, room):
         # ✅ Loop through all players on red and blue teams
         players_to_start = room.get('red_team', []) + room.get('blue_team', [])
 
@@ -260,24 +263,19 @@ def register_room_handlers(socketio, user_collection, room_collection):
 
         # Push all players at once
         if battlefield_players:
-            room_collection.update_one(
-                {'id': room_id},
-                {
-                    '$push': {'players': {'$each': battlefield_players}},
-                    '$set': {'game_started': True}  # ⬅️ Update here
-                }
-            )
+            room_store.start(room_id, battlefield_players)  # ⬅️ also sets game_started
 
-        # Emit updated players
-        updated_room = room_collection.find_one({'id': room_id})
+        # Emit updated players – the list we just pushed, no re-read
+        players = room.get('players', []) + battlefield_players
 
         players_out = []
-        for p in updated_room.get('players', []):
+        profiles = get_users(p['id'] for p in players)
+        for p in players:
             uid = p['id']
             avatar_fn = choose_avatar(
                 uid,
-                updated_room,
-                user_collection.find_one({'username': uid}) or {}
+                room,
+                profiles.get(uid, {})
             )
             players_out.append({
                 "id": uid,
@@ -287,61 +285,43 @@ def register_room_handlers(socketio, user_collection, room_collection):
                 "avatar": f"/static/avatars/{avatar_fn}"
             })
 
-        all_rooms = [
-            {"id": str(room["id"]), "name": html.escape(room["room_name"])}
-            for room in room_collection.find({"game_started": False})
-        ]
-        socketio.emit('room_list', all_rooms, namespace='/lobby')
+        # ➖ started rooms leave the open list
+        _open_rooms().pop(room_id, None)
+        socketio.emit('room_removed', {"id": room_id},
+                      room=ROOM_LIST_GROUP, namespace='/lobby')
 
         emit('player_positions', players_out, room=room_id)
 
         # Optionally, tell frontend: game started
         emit('game_started', room=room_id)
         kick_off_round_system(socketio, room_collection, room_id)
+        socketio.start_background_task(run_room_ticks, socketio, room_collection, room_id)
 
 
-    @socketio.on('disconnect', namespace='/lobby')
+    @metrics.on(socketio, 'disconnect', namespace='/lobby')
     def handle_disconnect():
         sid = request.sid
-        username = connected_users.pop(sid, None)
-
-        if not username:
+        unbind_sid(sid)
+        entry = untrack_sid(sid)
+        if not entry:
             return
 
+        # ✅ the index says which room – one atomic $pull, no scan
+        username, room_id, _ = entry
+        updated = room_store.leave_teams(room_id, username)
+        if updated:
+            _emit_lobby_state(room_id, updated)
+
 
-        # ✅ 1. First, find rooms BEFORE you modify the DB
-        rooms = list(room_collection.find({
-            "$or": [
-                {"red_team": username},
-                {"blue_team": username},
-                {"no_team": username},
-            ]
-        }))
-
-        # ✅ 2. Then remove the user
-        room_collection.update_many(
-            {"id": {"$in": [r["id"] for r in rooms]}},
-            {"$pull": {
-                "red_team": username,
-                "blue_team": username,
-                "no_team": username,
-            }}
-        )
-
-        # ✅ 3. Emit to all rooms the user was in
-        for room in rooms:
-            room_id = room["id"]
-            updated = room_collection.find_one({"id": room_id})
-            socketio.emit('team_red_list', updated["red_team"], room=room_id)
-            socketio.emit('team_blue_list', updated["blue_team"], room=room_id)
-            socketio.emit('no_team_list', updated["no_team"], room=room_id)
-            _emit_team_counts(room_id)
-
-
-    @socketio.on('connect', namespace='/lobby')
+    @metrics.on(socketio, 'connect', namespace='/lobby')
     def handle_connect():
         page = request.args.get('page')
         room_id = request.args.get('room_id')
+        # 🧭 team-select sockets go to the worker that will run the game
+        if page == 'team_select' and not owns_room(room_id):
+            return False
+        # 🔑 resolve the cookie once; events read the user bound to this sid
+        bind_sid(request.sid, request.cookies.get('auth_token'))
 
 
 # server-side battlefield terrain generation (Python)
@@ -3,14 +3,18 @@
 Very small helper that runs two 2-minute rounds, swaps taggers,
 shows a 5-second countdown banner, then declares the winner.
 
-All state is kept in-memory (round_state) plus MongoDB’s players
-list for tagger / team info.
+All state is kept in-memory (round_state + util.game_state); MongoDB’s
+players list is only refreshed at round boundaries.
 """
 
 import random, time
-from threading import Timer
 from typing     import Dict
 from flask_socketio import SocketIO
+from util import game_state
+from util.users import invalidate_user
+from util.leaderboard import invalidate_leaderboard
+from util import scheduler
+from util.room_store import RoomStore
 
 # ─── Tunables ────────────────────────────────────────────
 ROUND_TIME_SEC = 60          # 2-minute rounds
@@ -26,44 +30,51 @@ def kick_off_round_system(sock: SocketIO, room_collection, room_id: str) -> None
     first_taggers = random.choice(["red", "blue"])
     round_state[room_id] = {"round": 1, "taggers": first_taggers}
 
-    _flag_taggers_in_db(room_collection, room_id, first_taggers)
+    # 🧠 memory becomes authoritative for this room from here on
+    game_state.load_room(room_collection, room_id)
 
-    # ✨ Set initial attacking_team immediately
-    room_collection.update_one(
-        {'id': room_id},
-        {'$set': {'attacking_team': first_taggers}}
-    )
+    # ✨ taggers + initial attacking_team → one write
+    _flag_taggers(room_id, first_taggers)
+    game_state.sync_room_to_db(room_collection, room_id)
 
     _start_round(sock, room_id, room_collection)
 
 
+def teardown_room(room_id: str) -> None:
+    """Forget a room: pending countdowns / respawns, round + game state."""
+    scheduler.cancel_key(room_id)
+    round_state.pop(room_id, None)
+    game_state.drop_room(room_id)
+
+
 # ─── Internal helpers ───────────────────────────────────
-def _flag_taggers_in_db(room_collection, room_id: str, taggers: str) -> None:
-    """Set players.$[].is_tagger = True / False based on chosen colour."""
-    room = room_collection.find_one({"id": room_id})
-    if not room:
-        return
+def _flag_taggers(room_id: str, taggers: str) -> None:
+    """Set is_tagger = True / False based on chosen colour, and attacking_team.
 
-    new_players = []
-    for p in room.get("players", []):
-        p["is_tagger"] = (p.get("team") == taggers)
-        new_players.append(p)
+    Memory only – the caller persists it with game_state.sync_room_to_db.
+    """
+    state = game_state.get_room(room_id)
+    if not state:
+        return
 
-    room_collection.update_one({"id": room_id},
-                               {"$set": {"players": new_players}})
+    with game_state.rooms_lock:
+        state["attacking_team"] = taggers
+        for p in state["players"].values():
+            p["is_tagger"] = (p.get("team") == taggers)
 
 def _start_round(sock: SocketIO, room_id: str, room_collection) -> None:
     s = round_state[room_id]
 
     # ── 5-second pre-start countdown ────────────────────
     for sec in range(PAUSE_BETWEEN, 0, -1):
-        Timer(PAUSE_BETWEEN - sec,
+        scheduler.schedule(PAUSE_BETWEEN - sec,
               lambda x=sec: sock.emit('round_prep',
                                        {"seconds": x,
                                         "next_round": s["round"],
                                         "taggers":   s["taggers"]},
                                        room=room_id,
-                                       namespace='/battlefield')).start()
+                                       namespace='/battlefield'),
+              key=room_id)
 
     # ── Real start after PAUSE_BETWEEN seconds ──────────
     def _fire_start():
@@ -73,17 +84,21 @@ def _start_round(sock: SocketIO, room_id: str, room_collection) -> None:
                    "duration":  ROUND_TIME_SEC},
                   room=room_id, namespace='/battlefield')
         # schedule round end
-        Timer(ROUND_TIME_SEC, _end_round,
-              args=(sock, room_id, room_collection)).start()
+        scheduler.schedule(ROUND_TIME_SEC, _end_round,
+                           sock, room_id, room_collection, key=room_id)
 
-    Timer(PAUSE_BETWEEN, _fire_start).start()
+    scheduler.schedule(PAUSE_BETWEEN, _fire_start, key=room_id)
 
 def _end_round(sock: SocketIO, room_id: str, room_collection) -> None:
     s = round_state[room_id]
 
-    room = room_collection.find_one({'id': room_id}) or {}
-    red  = sum(1 for p in room.get('players', []) if p.get('team') == "red")
-    blue = sum(1 for p in room.get('players', []) if p.get('team') == "blue")
+    state = game_state.get_room(room_id)
+    if state:
+        players = game_state.players_list(state)
+    else:
+        players = RoomStore(room_collection).players(room_id)
+    red  = sum(1 for p in players if p.get('team') == "red")
+    blue = sum(1 for p in players if p.get('team') == "blue")
     winner = "draw"
     if   red  > blue: winner = "red"
     elif blue > red:  winner = "blue"
@@ -97,33 +112,30 @@ def _end_round(sock: SocketIO, room_id: str, room_collection) -> None:
                   {"winner": winner, "red": red, "blue": blue},
                   room=room_id, namespace='/battlefield')
 
-        # ✅ UPDATE USER WINS
+        # ✅ UPDATE USER WINS – one write for the whole winning team
         if winner in ["red", "blue"]:
-            winners = [p['id'] for p in room.get('players', []) if p.get('team') == winner]
-            for uid in winners:
-                room_collection.database['users'].update_one(  # ⚠️ adjust to your actual user collection
-                    {"username": uid},
+            winners = [p['id'] for p in players if p.get('team') == winner]
+            if winners:
+                room_collection.database['users'].update_many(  # ⚠️ adjust to your actual user collection
+                    {"username": {"$in": winners}},
                     {"$inc": {"wins": 1}}
                 )
+            for uid in winners:
+                invalidate_user(uid)
+            invalidate_leaderboard()
             sock.emit('leaderboard_updated', namespace='/lobby')
 
-        # 🔥 Cleanup room
-        room_collection.delete_one({'id': room_id})
-        round_state.pop(room_id, None)
+        # 🔥 Cleanup room (no final sync – the document is deleted anyway)
+        RoomStore(room_collection).delete(room_id)
+        teardown_room(room_id)
         return
 
-    # flip taggers for next round
+    # flip taggers for next round, then persist the round boundary:
+    # positions, teams, is_tagger and attacking_team in a single update
     s["taggers"] = "blue" if s["taggers"] == "red" else "red"
-    _flag_taggers_in_db(room_collection, room_id, s["taggers"])
-
-    # ✨ sync attacking_team in MongoDB too
-    room_collection.update_one(
-        {'id': room_id},
-        {'$set': {'attacking_team': s["taggers"]}}
-    )
+    _flag_taggers(room_id, s["taggers"])
+    game_state.sync_room_to_db(room_collection, room_id)
 
     # bump round counter and start next
     s["round"] += 1
     _start_round(sock, room_id, room_collection)
-
-
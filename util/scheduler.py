@@ -0,0 +1,114 @@
+# util/scheduler.py
+"""
+One green thread that fires every delayed game event (round countdowns,
+round start / end, respawns) for all rooms.
+
+Jobs sit in a heap ordered by due time; the runner sleeps until the
+earliest one is due (or until something earlier is scheduled) and hands
+each due job to a short-lived greenlet.  Jobs can carry a `key`
+(normally the room id) so everything for a room is cancelled in one
+call when the room is torn down.
+"""
+
+import heapq, itertools, logging, time
+from typing import Callable, Dict, List, Optional, Set
+import eventlet
+from eventlet.queue import LightQueue, Empty
+from eventlet.semaphore import Semaphore
+from util import metrics
+
+
+class Job:
+    __slots__ = ("when", "seq", "key", "fn", "args", "cancelled")
+
+    def __init__(self, when: float, seq: int, key, fn: Callable, args: tuple):
+        self.when, self.seq, self.key = when, seq, key
+        self.fn, self.args = fn, args
+        self.cancelled = False
+
+    def __lt__(self, other: "Job") -> bool:
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+# ─── Global memory ──────────────────────────────────────
+_heap: List[Job] = []
+_by_key: Dict[str, Set[Job]] = {}
+_seq = itertools.count()
+_lock = Semaphore()
+_wake = LightQueue()
+_runner = None
+
+
+# ─── Public entry-points ────────────────────────────────
+def schedule(delay: float, fn: Callable, *args, key: Optional[str] = None) -> Job:
+    """Run fn(*args) in <delay> seconds."""
+    global _runner
+    job = Job(time.monotonic() + max(delay, 0), next(_seq), key, fn, args)
+    with _lock:
+        heapq.heappush(_heap, job)
+        if key is not None:
+            _by_key.setdefault(key, set()).add(job)
+        earliest = _heap[0] is job
+        if _runner is None:
+            _runner = eventlet.spawn(_run)
+    if earliest:
+        _wake.put(None)
+    return job
+
+
+def cancel(job: Job) -> None:
+    with _lock:
+        job.cancelled = True
+        _forget(job)
+
+
+def cancel_key(key: str) -> int:
+    """Cancel every pending job for <key> (e.g. a room being torn down)."""
+    with _lock:
+        jobs = _by_key.pop(key, set())
+        for job in jobs:
+            job.cancelled = True
+    return len(jobs)
+
+
+def pending_count() -> int:
+    return sum(1 for job in _heap if not job.cancelled)
+
+
+# ─── Internal helpers ───────────────────────────────────
+def _run() -> None:
+    while True:
+        due = []
+        with _lock:
+            now = time.monotonic()
+            while _heap and (_heap[0].cancelled or _heap[0].when <= now):
+                job = heapq.heappop(_heap)
+                if not job.cancelled:
+                    _forget(job)
+                    due.append(job)
+            timeout = (_heap[0].when - now) if _heap else None
+
+        for job in due:
+            eventlet.spawn_n(_fire, job)
+
+        try:
+            _wake.get(timeout=timeout)
+        except Empty:
+            pass
+
+
+def _fire(job: Job) -> None:
+    name = getattr(job.fn, '__name__', job.fn)
+    try:
+        with metrics.handler(f"job:{name}"):
+            job.fn(*job.args)
+    except Exception:
+        logging.exception(f"Scheduled job {name} failed (key={job.key})")
+
+
+def _forget(job: Job) -> None:
+    jobs = _by_key.get(job.key)
+    if jobs is not None:
+        jobs.discard(job)
+        if not jobs:
+            del _by_key[job.key]
@@ -0,0 +1,118 @@
+# util/sessions.py
+"""
+Authenticated-session cache.
+
+    session_cache:  sha256(auth_token) → username   (TTL = cookie max-age)
+    sid_users:      Socket.IO sid      → username   (bound on connect)
+    sid_rooms:      Socket.IO sid      → (username, room_id, namespace)
+                                                    (set when the sid joins a room)
+
+HTTP requests resolve the cookie through `session_cache`; socket events
+use the username bound to their sid, so neither hits `users` by token
+after the first lookup.  Profile fields come from util.users.
+
+Disconnect handlers clean up from `sid_rooms` alone – no lookup queries,
+so a mass disconnect (proxy restart) doesn't turn into a scan storm.
+"""
+
+import hashlib
+from typing import Dict, Optional, Tuple
+from flask import request
+from util.cache import TTLCache
+from util.database import user_collection
+from util.users import get_user
+from util.cluster import CLUSTERED, CLUSTER_CACHE_TTL
+
+# ─── Tunables ────────────────────────────────────────────
+SESSION_TTL        = 3600     # matches the auth_token cookie max_age
+SESSION_CACHE_SIZE = 10000
+
+# a logout on another worker can't evict our entry → keep it short there
+session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE,
+                         ttl=CLUSTER_CACHE_TTL if CLUSTERED else SESSION_TTL)
+sid_users: Dict[str, str] = {}
+sid_rooms: Dict[str, Tuple[str, str, str]] = {}
+_user_sid: Dict[Tuple[str, str], str] = {}      # (namespace, username) → current sid
+
+
+# hash auth token for DB storage
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# ─── HTTP / token side ──────────────────────────────────
+def remember_session(hashed: str, username: str) -> None:
+    """Called on login; any older token of the same user is forgotten."""
+    session_cache.discard_where(lambda _, name: name == username)
+    session_cache.set(hashed, username)
+
+
+def forget_session(hashed: str) -> None:
+    session_cache.pop(hashed)
+
+
+def username_for_token(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    hashed = hash_token(token)
+    username = session_cache.get(hashed)
+    if username is None:
+        doc = user_collection.find_one({"auth_token": hashed}, {"_id": 0, "username": 1})
+        if not doc:
+            return None
+        username = doc["username"]
+        session_cache.set(hashed, username)
+    return username
+
+
+def user_for_token(token: Optional[str]) -> Optional[Dict]:
+    return get_user(username_for_token(token))
+
+
+# ─── Socket.IO side ─────────────────────────────────────
+def bind_sid(sid: str, token: Optional[str]) -> Optional[str]:
+    """Resolve the cookie once at connect and pin the user to <sid>."""
+    username = username_for_token(token)
+    if username:
+        sid_users[sid] = username
+    return username
+
+
+def unbind_sid(sid: str) -> Optional[str]:
+    return sid_users.pop(sid, None)
+
+
+def socket_user() -> Optional[Dict]:
+    """User for the current Socket.IO event (falls back to the cookie)."""
+    username = sid_users.get(request.sid)
+    if username is None:
+        username = bind_sid(request.sid, request.cookies.get('auth_token'))
+    return get_user(username)
+
+
+# ─── sid → room index ───────────────────────────────────
+def track_sid(sid: str, username: str, room_id: str, namespace: str) -> Optional[str]:
+    """Record that <sid> is <username> in <room_id>.
+
+    A user has one live sid per namespace: an older one (second tab,
+    reconnect) is dropped from the index and returned, so its disconnect
+    later doesn't remove the user again.
+    """
+    previous = _user_sid.get((namespace, username))
+    if previous == sid:
+        previous = None
+    elif previous is not None:
+        sid_rooms.pop(previous, None)
+    sid_rooms[sid] = (username, room_id, namespace)
+    _user_sid[(namespace, username)] = sid
+    return previous
+
+
+def untrack_sid(sid: str) -> Optional[Tuple[str, str, str]]:
+    """Forget <sid>; returns (username, room_id, namespace) if it was tracked."""
+    entry = sid_rooms.pop(sid, None)
+    if entry:
+        username, _, namespace = entry
+        if _user_sid.get((namespace, username)) == sid:
+            del _user_sid[(namespace, username)]
+    return entry
@@ -0,0 +1,225 @@
+# util/simulation.py
+"""
+Fixed-rate battlefield simulation.
+
+`move` events only queue the latest arrow-key state per player
+(room["inputs"], filled by util.inputs).  One green thread per started room wakes TICK_RATE
+times a second, applies the queued inputs, runs tagging, and emits a
+single compact snapshot with every player that moved (util.snapshots).  Outbound
+traffic per room is therefore bounded by the tick rate, not by how fast
+clients send input.
+"""
+
+import math, time
+from eventlet import sleep
+from eventlet.semaphore import Semaphore
+from util import game_state
+from util.terrain import is_blocked
+from util import snapshots
+from util import scheduler
+from util import metrics
+
+# ─── Tunables ────────────────────────────────────────────
+TICK_RATE   = 20                          # simulation ticks per second
+MOVE_SPEED  = 6.0                         # tiles / sec (old 0.1 per frame @ 60 fps)
+STEP        = round(MOVE_SPEED / TICK_RATE, 2)
+RESPAWN_SEC = 5
+
+# ─── Global memory ──────────────────────────────────────
+player_status = {}     # { room_id: { player_name: {"status": "alive"/"dead", "tagger": str} } }
+player_status_lock = Semaphore()
+
+
+# ─── Public entry-points ────────────────────────────────
+def run_room_ticks(socketio, room_collection, room_id: str) -> None:
+    """Green-thread body: tick until the room is dropped from game_state."""
+    interval  = 1.0 / TICK_RATE
+    next_tick = time.monotonic()
+    tick      = 0
+
+    while game_state.get_room(room_id):
+        tick += 1
+        started = time.perf_counter()
+        with metrics.handler('tick'):
+            _tick(socketio, room_collection, room_id, tick)
+        metrics.tick_seconds.observe(time.perf_counter() - started)
+
+        next_tick += interval
+        delay = next_tick - time.monotonic()
+        if delay < 0:                     # fell behind – don't try to catch up
+            next_tick, delay = time.monotonic(), 0
+        sleep(delay)
+
+
+# ─── Internal helpers ───────────────────────────────────
+def _tick(socketio, room_collection, room_id: str, tick: int) -> None:
+    room = game_state.get_room(room_id)
+    if not room:
+        return
+
+    with game_state.rooms_lock:
+        inputs, room['inputs'] = room['inputs'], {}
+
+    moved = []
+    for player, keys in inputs.items():
+        pos = _apply_move(room, player, keys)
+        if pos is None:
+            continue
+        moved.append([player, pos[0], pos[1]])
+        _check_tags(socketio, room_collection, room, player)
+
+    if moved:
+        snapshots.publish(socketio, room, tick, moved)   # JSON + binary fan-out
+
+
+def _apply_move(room, player, keyPress):
+    """Move <player> one STEP; returns the new (x, y) or None if it didn't move."""
+    room_id = room['id']
+    maps = room['collision']
+    width, height = room['width'], room['height']
+    player_data = room['players'].get(player)
+    if not player_data:
+        return None
+
+    with player_status_lock:
+        if player_status.get(room_id, {}).get(player, {}).get('status') == "dead":
+            return None
+
+    # movement logic
+    new_x, new_y = player_data['x'], player_data['y']
+    if keyPress.get('ArrowUp'):
+        new_y = round((new_y - STEP)*100)/100
+    if keyPress.get('ArrowDown'):
+        new_y = round((new_y + STEP)*100)/100
+    if keyPress.get('ArrowLeft'):
+        new_x = round((new_x - STEP)*100)/100
+    if keyPress.get('ArrowRight'):
+        new_x = round((new_x + STEP)*100)/100
+
+    x_check, y_check = False, False
+    if not 0 <= new_x <= width-1:
+        new_x = clamp(new_x, 0, width-1)
+        x_check = True
+    if not 0 <= new_y <= height-1:
+        new_y = clamp(new_y, 0, height-1)
+        y_check = True
+    if x_check and y_check:
+        return None
+
+    f_new_x = math.floor(new_x)
+    c_new_x = math.ceil(new_x) if new_x % 1 != 0 else f_new_x
+    f_new_y = math.floor(new_y)
+    c_new_y = math.ceil(new_y) if new_y % 1 != 0 else f_new_y
+
+    # one byte per corner from the team's precomputed bitmap
+    team = player_data.get('team')
+    blockedTL = is_blocked(maps, team, f_new_x, f_new_y)
+    blockedTR = is_blocked(maps, team, c_new_x, f_new_y)
+    blockedBL = is_blocked(maps, team, f_new_x, c_new_y)
+    blockedBR = is_blocked(maps, team, c_new_x, c_new_y)
+
+    if new_x != player_data['x'] and f_new_x != c_new_x:
+        if new_x < player_data['x']:
+            if blockedTL or blockedBL:
+                new_x = player_data['x']
+        elif new_x > player_data['x']:
+            if blockedTR or blockedBR:
+                new_x = player_data['x']
+
+    if new_y != player_data['y'] and f_new_y != c_new_y:
+        if new_y > player_data['y']:
+            if blockedBL or blockedBR:
+                new_y = player_data['y']
+        elif new_y < player_data['y']:
+            if blockedTL or blockedTR:
+                new_y = player_data['y']
+
+    if new_x == player_data['x'] and new_y == player_data['y']:
+        return None
+
+    with game_state.rooms_lock:
+        player_data['x'], player_data['y'] = new_x, new_y
+        room['grid'].move(player, new_x, new_y)
+    return new_x, new_y
+
+
+def _check_tags(socketio, room_collection, room, player) -> None:
+    """Tag the first enemy within one tile of <player>, if a team is attacking.
+
+    Only the 3×3 tiles around the mover are inspected (room['grid']).
+    """
+    room_id = room['id']
+    attacking_team = room.get('attacking_team')
+    player_data = room['players'].get(player)
+    if not attacking_team or not player_data:
+        return
+
+    new_x, new_y = player_data['x'], player_data['y']
+    with game_state.rooms_lock:
+        for other_id in list(room['grid'].nearby(new_x, new_y)):
+            target_data = room['players'].get(other_id)
+            if other_id == player or not target_data:
+                continue
+            if abs(target_data['x'] - new_x) <= 1 and abs(target_data['y'] - new_y) <= 1:
+                mover_team = player_data.get('team')
+                target_team = target_data.get('team')
+                if mover_team == target_team:
+                    continue
+
+                if mover_team == attacking_team:
+                    victim, tagger = other_id, player
+                elif target_team == attacking_team:
+                    victim, tagger = player, other_id
+                else:
+                    continue
+
+                with player_status_lock:
+                    if player_status.get(room_id, {}).get(victim, {}).get('status') == 'dead':
+                        continue
+                    player_status.setdefault(room_id, {})[victim] = {'status': 'dead', 'tagger': tagger}
+                socketio.emit('player_tagged', {'tagger': tagger, 'target': victim},
+                              room=room_id, namespace='/battlefield')
+                scheduler.schedule(RESPAWN_SEC, respawn_player,
+                                   socketio, room_collection, room_id, victim, key=room_id)
+                break
+
+
+def respawn_player(socketio, room_collection, room_id, player):
+    """Fired by util.scheduler RESPAWN_SEC after the tag.
+
+    The victim joins the tagger's team in memory (Mongo catches up at round
+    end) and clients get one small `player_team_changed` delta instead of
+    the full player list.
+    """
+    with player_status_lock:
+        status = player_status.get(room_id, {}).get(player)
+        if not status or status.get('status') != 'dead':
+            return
+        tagger = status.get('tagger')
+        player_status[room_id][player] = {"status": "alive"}
+
+    room = game_state.get_room(room_id)
+    if not room:
+        return
+
+    with game_state.rooms_lock:
+        tagger_data = room['players'].get(tagger)
+        victim_data = room['players'].get(player)
+        if not victim_data:
+            return
+        # a tagger who left mid-respawn leaves the victim on its own team
+        team = tagger_data['team'] if tagger_data else victim_data.get('team')
+        victim_data['team'] = team
+
+    socketio.emit('player_team_changed', {"player": player, "team": team},
+                  room=room_id, namespace='/battlefield')
+
+
+@game_state.on_drop
+def _forget_room(room_id):
+    with player_status_lock:
+        player_status.pop(room_id, None)
+
+
+def clamp(value, min_value, max_value):
+    return max(min_value, min(value, max_value))
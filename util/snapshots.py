@@ -0,0 +1,139 @@
+# util/snapshots.py
+"""
+Per-tick snapshot fan-out for /battlefield, JSON or (opt-in) binary.
+
+JSON clients sit in the "<room_id>:json" group and get the plain
+`room_snapshot` dict.  Clients that join with {"binary": true} instead
+get a one-off `roster` (slot → id / team / avatar) and then
+`snapshot_bin` frames: positions quantized to 1/100 tile and packed
+with `struct`, sent as deltas against the last snapshot the client
+acknowledged (`snapshot_ack`).  Unknown / expired baselines fall back to
+a keyframe.
+
+Wire format (little-endian):
+    header  <B I I H   flags, seq, base_seq, count   (flags & 1 → keyframe)
+    entry   <B H H     slot, x·100, y·100            keyframe
+    entry   <B h h     slot, Δx·100, Δy·100          delta vs base_seq
+"""
+
+import struct
+from array import array
+from typing import Dict, Optional
+from eventlet.semaphore import Semaphore
+from util import game_state
+
+# ─── Tunables ────────────────────────────────────────────
+QUANT        = 100            # fixed-point scale (positions are 2-decimal already)
+HISTORY_LEN  = 64             # snapshots kept per room for delta baselines
+
+FLAG_KEYFRAME = 1
+HEADER      = struct.Struct('<BIIH')
+KEY_ENTRY   = struct.Struct('<BHH')
+DELTA_ENTRY = struct.Struct('<Bhh')
+
+# ─── In-memory tracker:  sid → room_id (binary subscribers only) ──
+_sid_rooms: Dict[str, str] = {}
+_lock = Semaphore()
+
+
+def json_room(room_id: str) -> str:
+    """Socket.IO group for clients that still want JSON snapshots."""
+    return f"{room_id}:json"
+
+
+# ─── Subscription ───────────────────────────────────────
+def subscribe(room: Dict, sid: str) -> None:
+    with _lock:
+        room['bin_clients'][sid] = None     # no ack yet → keyframes
+        _sid_rooms[sid] = room['id']
+
+
+def acknowledge(sid: str, seq) -> None:
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        return                              # client payload: ignore anything odd
+    room = game_state.get_room(_sid_rooms.get(sid))
+    if room and seq in room['history']:
+        room['bin_clients'][sid] = seq
+
+
+def forget_sid(sid: str) -> None:
+    with _lock:
+        room = game_state.get_room(_sid_rooms.pop(sid, None))
+        if room:
+            room['bin_clients'].pop(sid, None)
+
+
+def roster(room: Dict, avatars: Dict[str, str]) -> list:
+    """Static per-player data, sent once to binary clients."""
+    return [
+        {"slot": slot, "id": pid,
+         "team": room['players'].get(pid, {}).get('team'),
+         "avatar": avatars.get(pid)}
+        for slot, pid in enumerate(room['slot_ids'])
+    ]
+
+
+# ─── Sending ────────────────────────────────────────────
+def send_keyframe(socketio, room: Dict, sid: str) -> None:
+    """Full binary snapshot to one sid (join / resync)."""
+    seq = room['seq']
+    current = _record(room, seq)
+    socketio.emit('snapshot_bin', _encode(room, seq, None, current),
+                  to=sid, namespace='/battlefield', ignore_queue=True)
+
+
+def publish(socketio, room: Dict, seq: int, moved: list) -> None:
+    """Called once per tick with [[id, x, y], ...] for every player that moved."""
+    room_id = room['id']
+    # every socket of a room is on this worker (util/cluster.py), so the
+    # per-tick frames skip the message queue
+    socketio.emit('room_snapshot', {'tick': seq, 'players': moved},
+                  room=json_room(room_id), namespace='/battlefield', ignore_queue=True)
+
+    room['seq'] = seq
+    if not room['bin_clients']:
+        return
+
+    current  = _record(room, seq)
+    payloads = {}                            # baseline seq → encoded frame
+    for sid, base in list(room['bin_clients'].items()):
+        if base not in payloads:
+            payloads[base] = _encode(room, seq, base, current)
+        socketio.emit('snapshot_bin', payloads[base], to=sid, namespace='/battlefield',
+                      ignore_queue=True)
+
+
+# ─── Internal helpers ───────────────────────────────────
+def _quantize(room: Dict) -> array:
+    out = array('H', bytes(4 * len(room['slot_ids'])))
+    for slot, pid in enumerate(room['slot_ids']):
+        p = room['players'].get(pid)
+        if p:
+            out[2 * slot]     = round(p['x'] * QUANT)
+            out[2 * slot + 1] = round(p['y'] * QUANT)
+    return out
+
+
+def _record(room: Dict, seq: int) -> array:
+    current = _quantize(room)
+    history = room['history']
+    history[seq] = current
+    while len(history) > HISTORY_LEN:
+        history.popitem(last=False)
+    return current
+
+
+def _encode(room: Dict, seq: int, base: Optional[int], current: array) -> bytes:
+    baseline = room['history'].get(base) if base is not None else None
+    if baseline is None or base == seq:
+        body = [KEY_ENTRY.pack(slot, current[2 * slot], current[2 * slot + 1])
+                for slot in range(len(current) // 2)]
+        return HEADER.pack(FLAG_KEYFRAME, seq, seq, len(body)) + b''.join(body)
+
+    body = []
+    for slot in range(len(current) // 2):
+        dx = current[2 * slot]     - baseline[2 * slot]
+        dy = current[2 * slot + 1] - baseline[2 * slot + 1]
+        if dx or dy:
+            body.append(DELTA_ENTRY.pack(slot, dx, dy))
+    return HEADER.pack(0, seq, base, len(body)) + b''.join(body)
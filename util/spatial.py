@@ -0,0 +1,61 @@
+# util/spatial.py
+"""
+Uniform-grid spatial index, one bucket per terrain tile.
+
+Players are re-bucketed only when they cross a tile boundary, so a move
+inside a tile is O(1).  `nearby` returns everyone in the 3×3 block of
+tiles around a point, which covers the ±1 tile tag range.
+"""
+
+import math
+from typing import Dict, Iterator, Set, Tuple
+
+Cell = Tuple[int, int]
+
+
+class SpatialGrid:
+    def __init__(self, width: int, height: int):
+        self.width  = width
+        self.height = height
+        self.cells: Dict[Cell, Set[str]] = {}     # (cx, cy) → player ids
+        self.where: Dict[str, Cell]      = {}     # player id → (cx, cy)
+
+    def _cell(self, x: float, y: float) -> Cell:
+        cx = min(max(math.floor(x), 0), self.width - 1)
+        cy = min(max(math.floor(y), 0), self.height - 1)
+        return cx, cy
+
+    def insert(self, pid: str, x: float, y: float) -> None:
+        cell = self._cell(x, y)
+        self.where[pid] = cell
+        self.cells.setdefault(cell, set()).add(pid)
+
+    def move(self, pid: str, x: float, y: float) -> None:
+        cell = self._cell(x, y)
+        old = self.where.get(pid)
+        if old == cell:
+            return
+        if old is not None:
+            self._discard(old, pid)
+        self.where[pid] = cell
+        self.cells.setdefault(cell, set()).add(pid)
+
+    def remove(self, pid: str) -> None:
+        old = self.where.pop(pid, None)
+        if old is not None:
+            self._discard(old, pid)
+
+    def nearby(self, x: float, y: float, radius: int = 1) -> Iterator[str]:
+        """Player ids in the (2·radius+1)² tiles around (x, y)."""
+        cx, cy = self._cell(x, y)
+        for ny in range(cy - radius, cy + radius + 1):
+            for nx in range(cx - radius, cx + radius + 1):
+                yield from self.cells.get((nx, ny), ())
+
+    def _discard(self, cell: Cell, pid: str) -> None:
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            return
+        bucket.discard(pid)
+        if not bucket:
+            del self.cells[cell]
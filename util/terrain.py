@@ -0,0 +1,144 @@
+# util/terrain.py
+"""
+Precomputed per-team collision bitmaps.
+
+Tile codes:  0 floor · 1 wall · 2 blue safe zone · 3 red safe zone.
+A team is blocked by walls and by the *enemy* safe zone, so each room
+gets one flat `bytearray` per team (row-major, 1 = blocked) built once
+when the game starts (util.game_state.load_room) on the worker that runs
+it.  Movement tests a single byte instead of decoding the nested terrain
+lists.
+
+Terrains themselves are stored once, as packed blobs keyed by a hash of
+their content:
+
+    terrains: {"_id": <sha1 hex>, "blob": <bytes>}
+    blob:     <BHH version, width, height · 2 bits per tile, row-major,
+              first tile in the low bits of each byte
+
+Room documents only carry `terrain_id`; browsers fetch the blob from
+/terrain/<terrain_id> (util/battlefield.py), which never changes and so
+can be cached for good.
+"""
+
+import hashlib, struct
+from typing import Dict, List, Optional
+from bson.binary import Binary
+from eventlet.semaphore import Semaphore
+from util.cache import TTLCache
+from util.database import terrain_collection
+
+WALL      = 1
+BLUE_SAFE = 2
+RED_SAFE  = 3
+
+# team → tiles it may not enter
+BLOCKING_TILES = {
+    "red":  (WALL, BLUE_SAFE),
+    "blue": (WALL, RED_SAFE),
+}
+
+BLOB_VERSION   = 1
+BLOB_HEADER    = struct.Struct('<BHH')
+TILE_BITS      = 2
+TILES_PER_BYTE = 8 // TILE_BITS
+
+# ─── In-memory cache:  terrain_id → blob (content-addressed, never stale) ──
+terrain_blobs = TTLCache(maxsize=512, ttl=3600.0)
+
+# ─── In-memory cache:  room_id → collision maps (see build_collision_maps) ──
+collision_maps: Dict[str, Dict] = {}
+collision_maps_lock = Semaphore()
+
+
+def build_collision_maps(terrain: List[List[int]]) -> Dict:
+    """{"width", "height", "red": bytearray, "blue": bytearray}"""
+    height = len(terrain)
+    width  = len(terrain[0]) if height else 0
+    maps = {"width": width, "height": height}
+    for team, tiles in BLOCKING_TILES.items():
+        maps[team] = bytearray(
+            1 if tile in tiles else 0
+            for row in terrain for tile in row
+        )
+    return maps
+
+
+def cache_room_maps(room_id: str, terrain: List[List[int]]) -> Dict:
+    maps = build_collision_maps(terrain)
+    with collision_maps_lock:
+        collision_maps[room_id] = maps
+    return maps
+
+
+def maps_for(room_id: str, terrain: List[List[int]]) -> Dict:
+    """Cached maps for <room_id>, built from <terrain> on first use."""
+    maps = collision_maps.get(room_id)
+    if maps is None:
+        maps = cache_room_maps(room_id, terrain)
+    return maps
+
+
+def drop_room_maps(room_id: str) -> None:
+    with collision_maps_lock:
+        collision_maps.pop(room_id, None)
+
+
+def is_blocked(maps: Dict, team: str, x: int, y: int) -> bool:
+    blocked = maps.get(team) or maps["red"]   # unknown team → old default (red rules)
+    return blocked[y * maps["width"] + x] == 1
+
+
+# ─── Packed, content-addressed terrains ─────────────────
+def pack_terrain(terrain: List[List[int]]) -> bytes:
+    height = len(terrain)
+    width  = len(terrain[0]) if height else 0
+    tiles = [tile for row in terrain for tile in row]
+    packed = bytearray((len(tiles) + TILES_PER_BYTE - 1) // TILES_PER_BYTE)
+    for i, tile in enumerate(tiles):
+        packed[i // TILES_PER_BYTE] |= (tile & 0b11) << (TILE_BITS * (i % TILES_PER_BYTE))
+    return BLOB_HEADER.pack(BLOB_VERSION, width, height) + bytes(packed)
+
+
+def unpack_terrain(blob: bytes) -> List[List[int]]:
+    version, width, height = BLOB_HEADER.unpack_from(blob)
+    if version != BLOB_VERSION:
+        raise ValueError(f"unknown terrain blob version {version}")
+    packed = blob[BLOB_HEADER.size:]
+    tiles = [(packed[i // TILES_PER_BYTE] >> (TILE_BITS * (i % TILES_PER_BYTE))) & 0b11
+             for i in range(width * height)]
+    return [tiles[y * width:(y + 1) * width] for y in range(height)]
+
+
+def terrain_key(blob: bytes) -> str:
+    return hashlib.sha1(blob).hexdigest()
+
+
+def save_terrain(terrain: List[List[int]]) -> str:
+    """Store <terrain> (once per distinct layout) and return its terrain_id."""
+    blob = pack_terrain(terrain)
+    terrain_id = terrain_key(blob)
+    if terrain_blobs.get(terrain_id) is None:
+        terrain_collection.update_one(
+            {"_id": terrain_id},
+            {"$setOnInsert": {"blob": Binary(blob)}},
+            upsert=True
+        )
+        terrain_blobs.set(terrain_id, blob)
+    return terrain_id
+
+
+def terrain_blob(terrain_id: str) -> Optional[bytes]:
+    blob = terrain_blobs.get(terrain_id)
+    if blob is None:
+        doc = terrain_collection.find_one({"_id": terrain_id}, {"blob": 1})
+        if not doc:
+            return None
+        blob = bytes(doc["blob"])
+        terrain_blobs.set(terrain_id, blob)
+    return blob
+
+
+def load_terrain(terrain_id: str) -> Optional[List[List[int]]]:
+    blob = terrain_blob(terrain_id)
+    return unpack_terrain(blob) if blob is not None else None
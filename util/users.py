@@ -0,0 +1,57 @@
+# util/users.py
+"""
+Cached user-profile lookups keyed by username.
+
+Avatar resolution and anything else that only needs a user's public
+fields should go through here instead of hitting `users` per player.
+Call `invalidate_user` whenever a profile field changes (avatar upload,
+wins, ...).
+"""
+
+from typing import Dict, Iterable, Optional
+from util.cache import TTLCache
+from util.database import user_collection
+from util.cluster import CLUSTERED, CLUSTER_CACHE_TTL
+
+# ─── Tunables ────────────────────────────────────────────
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL  = 300         # seconds
+
+# never cache credentials
+_PROFILE_FIELDS = {"_id": 0, "password": 0, "auth_token": 0}
+
+# invalidate_user only reaches this process
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE,
+                      ttl=min(USER_CACHE_TTL, CLUSTER_CACHE_TTL) if CLUSTERED else USER_CACHE_TTL)
+
+
+def get_user(username: str) -> Optional[Dict]:
+    if not username:
+        return None
+    user = user_cache.get(username)
+    if user is None:
+        user = user_collection.find_one({"username": username}, _PROFILE_FIELDS)
+        if user:
+            user_cache.set(username, user)
+    return user
+
+
+def get_users(usernames: Iterable[str]) -> Dict[str, Dict]:
+    """Batch lookup: one `$in` query for whatever isn't cached yet."""
+    found, missing = {}, []
+    for name in set(usernames):
+        user = user_cache.get(name)
+        if user is None:
+            missing.append(name)
+        else:
+            found[name] = user
+
+    if missing:
+        for user in user_collection.find({"username": {"$in": missing}}, _PROFILE_FIELDS):
+            user_cache.set(user["username"], user)
+            found[user["username"]] = user
+    return found
+
+
+def invalidate_user(username: str) -> None:
+    user_cache.pop(username)